@@ -26,9 +26,13 @@ from enterprise_functions import (
     fetch_weather,
     fetch_datetime,
     fetch_stock_price,
+    fetch_stock_prices,
     send_email
 )
 
+# Size limits for tool outputs before submit_tool_outputs
+from tool_output_budget import budget_tool_output
+
 # converter
 from ai_agent_converter import AIAgentConverter
 print("AIAgentConverter loaded", AIAgentConverter)
@@ -48,8 +52,11 @@ function_titles = {
     "fetch_weather": "☁️ fetching weather",
     "fetch_datetime": "🕒 fetching datetime",
     "fetch_stock_price": "📈 fetching financial info",
+    "fetch_stock_prices": "📈 fetching financial info",
     "send_email": "✉️ sending mail",
+    "get_email_status": "✉️ checking mail status",
     "file_search": "📄 searching docs",
+    "search_policies": "📄 searching policies",
     "bing_grounding": "🔍 searching bing",
 }
 
@@ -163,7 +170,7 @@ def process_batch_messages(user_messages: List[str]) -> List[Dict]:
             "You are a helpful enterprise assistant at Contoso. "
             f"Today's date is {datetime.now().strftime('%A, %b %d, %Y, %I:%M %p')}. "
             "You have access to hr documents in file_search, the grounding engine from bing "
-            "and custom python functions such as  fetch_datetime, fetch_weather, fetch_stock_price, send_email"
+            "and custom python functions such as  fetch_datetime, fetch_weather, fetch_stock_price, fetch_stock_prices, send_email"
             " For weather queries, use user-provided location; otherwise, always set to location to 'Seattle'."
             "Provide well-structured, concise, and professional answers."
         )
@@ -334,7 +341,12 @@ def process_batch_messages(user_messages: List[str]) -> List[Dict]:
                                                     raise ValueError("Missing required email parameters")
                                                 
                                             result = fn(**fn_args_dict)
-                                            output = str(result)
+                                            output, clip = budget_tool_output(fn_name, str(result))
+                                            if clip:
+                                                print(
+                                                    f"Clipped {fn_name} output from {clip['original_chars']} "
+                                                    f"to {clip['final_chars']} chars ({clip['strategy']})"
+                                                )
                                             tool_outputs.append({
                                                 "tool_call_id": tool_call.id,
                                                 "output": output
@@ -0,0 +1,205 @@
+"""
+A durable local outbox for send_email.
+
+Messages are written to a SQLite file and acknowledged with an id straight away; a
+background worker thread claims due messages in batches and posts them one by one (the
+Logic App takes one message per request), retrying transient failures with exponential
+backoff. The message id is sent along as an idempotency key so the Logic App can drop
+duplicates if a delivery is retried after a lost response. Several processes (e.g.
+gunicorn workers) can share one outbox file: batches are claimed with a lease inside a
+write transaction, so a message is only in flight in one place.
+
+The worker is a daemon thread, so a short-lived process (e.g. batch-agent.py) should
+call flush() before it exits, or mail queued at the end stays in the file until some
+later process starts the outbox.
+"""
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# deliver(message) -> (delivered, retryable, detail)
+Deliver = Callable[[Dict[str, Any]], Tuple[bool, bool, Any]]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id TEXT PRIMARY KEY,
+    recipient TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    response TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+"""
+
+
+class EmailOutbox:
+    """
+    Statuses: "queued" (waiting or backing off), "sending" (claimed under a lease),
+    "sent", and "failed" (permanent error or attempts exhausted).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        deliver: Deliver,
+        batch_size: int = 10,
+        max_attempts: int = 5,
+        base_backoff_seconds: float = 2.0,
+        lease_seconds: float = 60.0,
+        poll_interval_seconds: float = 2.0,
+    ):
+        self.path = path
+        self._deliver = deliver
+        self._batch_size = batch_size
+        self._max_attempts = max_attempts
+        self._base_backoff = base_backoff_seconds
+        self._lease_seconds = lease_seconds
+        self._poll_interval = poll_interval_seconds
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def enqueue(self, recipient: str, subject: str, body: str) -> str:
+        """Persists a message and returns its id; delivery happens in the background."""
+        email_id = uuid.uuid4().hex
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO outbox (id, recipient, subject, body, status, next_attempt_at,"
+                " created_at, updated_at) VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)",
+                (email_id, recipient, subject, body, now, now, now),
+            )
+        self.start()
+        self._wakeup.set()
+        return email_id
+
+    def status(self, email_id: str) -> Optional[Dict[str, Any]]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT id, recipient, status, attempts, last_error, response, created_at, updated_at"
+                " FROM outbox WHERE id = ?",
+                (email_id,),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def start(self) -> None:
+        """Starts the delivery worker for this process (idempotent)."""
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stopping.clear()
+                self._worker = threading.Thread(
+                    target=self._run, name="email-outbox", daemon=True
+                )
+                self._worker.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def _claim_batch(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT * FROM outbox WHERE status IN ('queued', 'sending') AND next_attempt_at <= ?"
+                " ORDER BY next_attempt_at LIMIT ?",
+                (now, self._batch_size),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET status = 'sending', attempts = attempts + 1,"
+                " next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                [(now + self._lease_seconds, now, row["id"]) for row in rows],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return [dict(row, attempts=row["attempts"] + 1) for row in rows]
+
+    def _record(self, message: Dict[str, Any], delivered: bool, retryable: bool, detail: Any) -> None:
+        now = time.time()
+        if delivered:
+            status, next_attempt_at, error, response = "sent", now, None, str(detail)
+        elif retryable and message["attempts"] < self._max_attempts:
+            backoff = self._base_backoff * (2 ** (message["attempts"] - 1))
+            status, next_attempt_at, error, response = "queued", now + backoff, str(detail), None
+        else:
+            status, next_attempt_at, error, response = "failed", now, str(detail), None
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE outbox SET status = ?, next_attempt_at = ?, last_error = ?, response = ?,"
+                " updated_at = ? WHERE id = ?",
+                (status, next_attempt_at, error, response, now, message["id"]),
+            )
+
+    def _deliver_batch(self, batch: List[Dict[str, Any]]) -> None:
+        for message in batch:
+            try:
+                delivered, retryable, detail = self._deliver(message)
+            except Exception as e:
+                delivered, retryable, detail = False, True, f"{type(e).__name__}: {e}"
+            self._record(message, delivered, retryable, detail)
+
+    def _pending(self) -> Tuple[int, Optional[float]]:
+        """(number of undelivered messages, when the next one is due)."""
+        with closing(self._connect()) as conn:
+            count, next_due = conn.execute(
+                "SELECT COUNT(*), MIN(next_attempt_at) FROM outbox WHERE status IN ('queued', 'sending')"
+            ).fetchone()
+        return count, next_due
+
+    def flush(self, timeout: float) -> int:
+        """
+        Delivers due messages in the calling thread until none are pending or `timeout`
+        seconds have passed, waiting out backoffs and other workers' leases in between.
+        Returns how many messages are still pending.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            batch = self._claim_batch()
+            self._deliver_batch(batch)
+            pending, next_due = self._pending()
+            remaining = deadline - time.monotonic()
+            if not pending or remaining <= 0:
+                return pending
+            if not batch:
+                time.sleep(min(max(next_due - time.time(), 0.05), remaining, self._poll_interval))
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                batch = self._claim_batch()
+            except sqlite3.Error as e:
+                print(f"email outbox > claim failed: {e}")
+                batch = []
+
+            self._deliver_batch(batch)
+
+            # A full batch likely means more is due; otherwise wait for new work or the next retry.
+            if len(batch) < self._batch_size:
+                self._wakeup.wait(self._poll_interval)
+                self._wakeup.clear()
@@ -0,0 +1,186 @@
+"""
+Record/replay fixtures for the upstream services behind the enterprise tools.
+
+With HTTP_FIXTURES_MODE=record, every OpenWeather and Logic App response (and every
+Yahoo Finance history frame) seen during a real run is appended to a JSON-lines file
+together with how long it took. With HTTP_FIXTURES_MODE=replay, the tools are served
+from that file instead of the network, so tool-layer changes can be benchmarked
+reproducibly on a disconnected machine.
+
+    HTTP_FIXTURES_MODE=off|record|replay
+    HTTP_FIXTURES_PATH=test_data/http_fixtures.jsonl
+    HTTP_FIXTURES_LATENCY=original|zero|<scale>   e.g. 0.5 replays at half the recorded latency
+
+API keys and Logic App signatures are redacted from recorded URLs and never written out.
+Identical requests are replayed in recorded order (the last recording repeats once they
+run out); a request that was never recorded raises FixtureMiss.
+
+Run `python http_fixtures.py` to check that history frames survive a record/replay round trip.
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HTTP_FIXTURES_MODE = os.getenv("HTTP_FIXTURES_MODE", "off").lower()
+HTTP_FIXTURES_PATH = os.getenv("HTTP_FIXTURES_PATH", "test_data/http_fixtures.jsonl")
+HTTP_FIXTURES_LATENCY = os.getenv("HTTP_FIXTURES_LATENCY", "original").lower()
+
+# Query/param names that carry credentials (OpenWeather appid, Logic App SAS signature).
+_SECRET_PARAMS = {"appid", "api_key", "apikey", "key", "code", "sig"}
+_REDACTED = "REDACTED"
+
+
+class FixtureMiss(LookupError):
+    """Raised in replay mode for a request that has no recording."""
+
+
+class FixtureResponse:
+    """The parts of a requests/httpx response the tools read, rebuilt from a recording."""
+
+    def __init__(self, payload: Dict[str, Any]):
+        self.status_code = payload["status_code"]
+        self.text = payload["text"]
+        self.headers = payload.get("headers", {})
+
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+
+def _redact_params(params: Any) -> List[Tuple[str, str]]:
+    items = params.items() if isinstance(params, dict) else (params or [])
+    return sorted(
+        (str(k), _REDACTED if str(k).lower() in _SECRET_PARAMS else str(v)) for k, v in items
+    )
+
+
+def http_request_fixture(method: str, url: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """The recorded (and matched) form of a request: method, redacted URL/params and body."""
+    parts = urlsplit(url)
+    query = _redact_params(parse_qsl(parts.query))
+    return {
+        "method": method.upper(),
+        "url": urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), "")),
+        "params": _redact_params(kwargs.get("params")),
+        "json": kwargs.get("json"),
+    }
+
+
+def http_response_fixture(response: Any) -> Dict[str, Any]:
+    return {
+        "status_code": response.status_code,
+        "text": response.text,
+        "headers": {"content-type": response.headers.get("content-type", "")},
+    }
+
+
+def frame_to_fixture(frame: Any) -> Dict[str, Any]:
+    """Serializes a yfinance history/download DataFrame (including ticker-grouped columns)."""
+    return {
+        "index": [ts.isoformat() for ts in frame.index],
+        "index_name": frame.index.name,
+        # Offsets differ across a DST change, so the zone is kept to rebuild the index
+        "tz": str(frame.index.tz) if getattr(frame.index, "tz", None) is not None else None,
+        "columns": [list(c) if isinstance(c, tuple) else c for c in frame.columns],
+        "column_names": list(frame.columns.names),
+        "data": frame.astype(object).where(frame.notna(), None).values.tolist(),
+    }
+
+
+def frame_from_fixture(payload: Dict[str, Any]) -> Any:
+    import pandas as pd
+
+    columns: Any = payload["columns"]
+    if columns and isinstance(columns[0], list):
+        columns = pd.MultiIndex.from_tuples([tuple(c) for c in columns], names=payload["column_names"])
+    tz = payload.get("tz")
+    if tz:
+        timestamps = pd.to_datetime(payload["index"], utc=True).tz_convert(tz)
+    else:
+        timestamps = pd.to_datetime(payload["index"])
+    index = pd.DatetimeIndex(timestamps, name=payload["index_name"])
+    frame = pd.DataFrame(payload["data"], index=index, columns=columns)
+    return frame.apply(pd.to_numeric)
+
+
+class FixtureStore:
+    def __init__(self, path: str, mode: str, latency: str = "original"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown fixtures mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self._latency_scale = (
+            1.0 if latency == "original" else 0.0 if latency == "zero" else float(latency)
+        )
+        self._lock = threading.Lock()
+        self._recordings: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursors: Dict[str, int] = {}
+        if mode == "replay":
+            self._load()
+        elif os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    @staticmethod
+    def _key(kind: str, request: Dict[str, Any]) -> str:
+        return json.dumps([kind, request], sort_keys=True, default=str)
+
+    def _load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    key = self._key(entry["kind"], entry["request"])
+                    self._recordings.setdefault(key, []).append(entry)
+        count = sum(len(v) for v in self._recordings.values())
+        print(f"fixtures > replaying {count} recordings from {self.path}")
+
+    def record(self, kind: str, request: Dict[str, Any], response: Any, latency: float) -> None:
+        entry = {"kind": kind, "request": request, "response": response, "latency": round(latency, 4)}
+        line = json.dumps(entry, default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def replay(self, kind: str, request: Dict[str, Any]) -> Tuple[Any, float]:
+        """Returns (recorded response, delay to apply) for the next recording of a request."""
+        key = self._key(kind, request)
+        with self._lock:
+            recordings = self._recordings.get(key)
+            if not recordings:
+                raise FixtureMiss(f"No {kind} recording for {json.dumps(request, default=str)}")
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+        entry = recordings[min(cursor, len(recordings) - 1)]
+        return entry["response"], entry["latency"] * self._latency_scale
+
+
+def _from_env() -> Optional[FixtureStore]:
+    if HTTP_FIXTURES_MODE in ("", "off"):
+        return None
+    print(f"fixtures > {HTTP_FIXTURES_MODE} mode ({HTTP_FIXTURES_PATH}, latency={HTTP_FIXTURES_LATENCY})")
+    return FixtureStore(HTTP_FIXTURES_PATH, HTTP_FIXTURES_MODE, HTTP_FIXTURES_LATENCY)
+
+
+# The process-wide store used by enterprise_functions(_aio); None when fixtures are off.
+fixtures = _from_env()
+
+
+if __name__ == "__main__":
+    import pandas as pd
+
+    # Daily closes as Yahoo returns them for a US listing: tz-aware, across the March and
+    # November DST changes (the UTC offsets in the index change in the middle)
+    for start in ("2024-03-04", "2024-10-28"):
+        index = pd.date_range(start, periods=14, freq="D", tz="America/New_York", name="Date")
+        frame = pd.DataFrame({"Close": [100.0 + i for i in range(14)], "Volume": [1000 * i for i in range(14)]}, index=index)
+        frame.iloc[3, 0] = float("nan")
+        restored = frame_from_fixture(json.loads(json.dumps(frame_to_fixture(frame))))
+        pd.testing.assert_frame_equal(restored, frame, check_dtype=False, check_freq=False)
+        print(f"round trip ok: {index[0].date()} .. {index[-1].date()} ({index.tz})")
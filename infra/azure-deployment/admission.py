@@ -0,0 +1,186 @@
+"""
+Admission control for agent runs in one worker.
+
+At most `max_concurrent` chat responses stream at once. Further requests wait in a FIFO
+queue of at most `max_queue` entries for up to `queue_timeout` seconds; when the queue is
+full or the wait times out they are turned away straight away with AdmissionRejected, so
+the admitted requests keep predictable latency instead of everyone slowing down together.
+
+Both the thread-based (sync) handlers and the asyncio handlers share one controller.
+On shutdown, start_draining() turns every new and queued request away ("draining") while
+the admitted ones finish; wait_idle() waits for them.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Deque, Iterator, Optional
+
+
+class AdmissionRejected(RuntimeError):
+    def __init__(self, reason: str, retry_after: int):
+        state = "Server restarting" if reason == "draining" else "Server busy"
+        super().__init__(f"{state} ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.granted = False
+        self.loop = loop
+        self.future: Optional["asyncio.Future[None]"] = loop.create_future() if loop else None
+        self.event: Optional[threading.Event] = None if loop else threading.Event()
+
+    def wake(self) -> None:
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+        else:
+            self.event.set()
+
+
+class Ticket:
+    """An admitted slot; release() is idempotent."""
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release()
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_queue: int,
+        queue_timeout: float,
+        retry_after: int = 5,
+        on_admitted: Optional[Callable[[float], None]] = None,
+        on_rejected: Optional[Callable[[str], None]] = None,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._on_admitted = on_admitted
+        self._on_rejected = on_rejected
+        self.active = 0
+        self.draining = False
+        self._waiters: Deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _enter(self, waiter_factory) -> Optional[_Waiter]:
+        """Takes a free slot (returns None) or enqueues a waiter; raises when the queue is full."""
+        with self._lock:
+            draining = self.draining
+            if not draining and self.active < self.max_concurrent and not self._waiters:
+                self.active += 1
+                return None
+            queue_full = len(self._waiters) >= self.max_queue
+            if not draining and not queue_full:
+                waiter = waiter_factory()
+                self._waiters.append(waiter)
+        if draining:
+            self._reject("draining")
+        if queue_full:
+            self._reject("queue full")
+        return waiter
+
+    def _settle(self, waiter: _Waiter) -> None:
+        """After a wait ends: keeps a slot that was handed over, otherwise leaves the queue and rejects."""
+        with self._lock:
+            if waiter.granted:
+                return  # the slot may be handed over just as the deadline passes; keep it
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self._reject("draining" if self.draining else "queue timeout")
+
+    def _reject(self, reason: str) -> None:
+        if self._on_rejected:
+            self._on_rejected(reason)
+        raise AdmissionRejected(reason, self.retry_after)
+
+    def _admitted(self, started: float) -> "Ticket":
+        if self._on_admitted:
+            self._on_admitted(time.monotonic() - started)
+        return Ticket(self)
+
+    def _release(self) -> None:
+        with self._lock:
+            if self._waiters:
+                # Hand the slot straight to the oldest waiter; `active` stays the same
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                waiter.wake()
+            else:
+                self.active -= 1
+
+    def acquire(self) -> Ticket:
+        started = time.monotonic()
+        waiter = self._enter(_Waiter)
+        if waiter is not None:
+            waiter.event.wait(self.queue_timeout)
+            self._settle(waiter)
+        return self._admitted(started)
+
+    async def acquire_async(self) -> Ticket:
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        waiter = self._enter(lambda: _Waiter(loop))
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                # Leaving the queue: give the slot back if it was already handed to us
+                with self._lock:
+                    granted = waiter.granted
+                    if not granted and waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                if granted:
+                    self._release()
+                raise
+            self._settle(waiter)
+        return self._admitted(started)
+
+    def start_draining(self) -> None:
+        """Stops admitting: queued requests are rejected now, new ones on arrival."""
+        with self._lock:
+            self.draining = True
+            waiters = list(self._waiters)
+            self._waiters.clear()
+        for waiter in waiters:
+            waiter.wake()
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """Waits up to `timeout` seconds for the admitted requests to finish; True if they did."""
+        deadline = time.monotonic() + timeout
+        while self.active > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        return self.active == 0
+
+    @contextmanager
+    def slot(self) -> Iterator[Ticket]:
+        ticket = self.acquire()
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    @asynccontextmanager
+    async def slot_async(self) -> AsyncIterator[Ticket]:
+        ticket = await self.acquire_async()
+        try:
+            yield ticket
+        finally:
+            ticket.release()
@@ -0,0 +1,157 @@
+"""
+One-time agent bootstrap shared by the gunicorn workers of an instance.
+
+Every worker imports main.py, and each used to list agents, look up the Bing connection
+and vector store, and call update_agent on its own - concurrently, on every start. Here
+the first worker to get the file lock resolves the agent and tool ids and writes them to
+a small JSON cache; the other workers wait on the lock and read the cache. Only the ids
+are cached: the agent's model and instructions are always read fresh (one get_agent call),
+so an edit to the agent is never overwritten with stale values. update_agent is only
+called when the hash of the model, instructions and tool definitions differs from the one
+last applied, so restarts with an unchanged toolset make no agent updates at all.
+
+    AGENT_BOOTSTRAP_CACHE=/tmp/agent_bootstrap.json   (the lock file is <cache>.lock)
+    AGENT_BOOTSTRAP_TTL_SECONDS=3600                   re-resolve ids after this long
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: single process, no lock needed
+    fcntl = None
+
+AGENT_BOOTSTRAP_CACHE = os.getenv(
+    "AGENT_BOOTSTRAP_CACHE", os.path.join(tempfile.gettempdir(), "agent_bootstrap.json")
+)
+AGENT_BOOTSTRAP_TTL_SECONDS = float(os.getenv("AGENT_BOOTSTRAP_TTL_SECONDS", "3600"))
+
+
+@contextmanager
+def _file_lock(path: str) -> Iterator[None]:
+    with open(path, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_cache(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache(path: str, cache: Dict[str, Any]) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, path)
+
+
+def agent_config_hash(model: str, instructions: Optional[str], toolset: Any) -> str:
+    """Hash of everything update_agent would send: model, instructions, tool definitions and resources."""
+    payload = {
+        "model": model,
+        "instructions": instructions,
+        "tools": [d.as_dict() for d in toolset.definitions],
+        "resources": toolset.resources.as_dict() if toolset.resources else None,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def resolve_agent(
+    project_client: Any, agent_name: str, bing_connection_name: str, vector_store_name: str
+) -> Dict[str, Any]:
+    """Looks up the agent, Bing connection and vector store ids (the API calls bootstrap caches)."""
+    found_agent = next(
+        (a for a in project_client.agents.list_agents().data if a.name == agent_name), None
+    )
+    if not found_agent:
+        raise ValueError(f"Agent with name '{agent_name}' not found.")
+    print(f"Using agent > {found_agent.name} (id: {found_agent.id})")
+
+    try:
+        bing_connection_id = project_client.connections.get(connection_name=bing_connection_name).id
+        print("bing > connected")
+    except Exception as e:
+        bing_connection_id = None
+        print(f"bing failed > no connection found or permission issue: {e}")
+
+    existing_vector_store = next(
+        (s for s in project_client.agents.list_vector_stores().data if s.name == vector_store_name),
+        None,
+    )
+    vector_store_id = existing_vector_store.id if existing_vector_store else None
+    if existing_vector_store:
+        print(f"reusing vector store > {existing_vector_store.name} (id: {existing_vector_store.id})")
+
+    return {
+        "agent_id": found_agent.id,
+        "agent_name": found_agent.name,
+        "bing_connection_id": bing_connection_id,
+        "vector_store_id": vector_store_id,
+    }
+
+
+def register_toolset(agents: Any, agent_id: str, toolset: Any) -> None:
+    """
+    Makes `agents` (a sync or async Agents client) execute `toolset`'s local functions for
+    `agent_id` while streaming. Workers that skip update_agent still need this.
+    """
+    if hasattr(agents, "enable_auto_function_calls"):
+        agents.enable_auto_function_calls(toolset)
+    else:
+        # Clients without enable_auto_function_calls only register a toolset through
+        # create_agent/update_agent; this fills the same per-agent map those calls do.
+        agents._toolset[agent_id] = toolset
+
+
+def bootstrap_agent(
+    project_client: Any,
+    agent_name: str,
+    bing_connection_name: str,
+    vector_store_name: str,
+    build_toolset: Callable[[Dict[str, Any]], Any],
+    update_agent: Callable[[Dict[str, Any], Any], Any],
+    cache_path: str = AGENT_BOOTSTRAP_CACHE,
+    ttl_seconds: float = AGENT_BOOTSTRAP_TTL_SECONDS,
+):
+    """
+    Returns (resolved ids, toolset). build_toolset(resolved) makes this worker's toolset;
+    update_agent(resolved, toolset) is called at most once per configuration change.
+    """
+    key = [agent_name, bing_connection_name, vector_store_name]
+    with _file_lock(f"{cache_path}.lock"):
+        cache = _read_cache(cache_path)
+        fresh = cache.get("key") == key and time.time() - cache.get("resolved_at", 0) < ttl_seconds
+        if fresh:
+            resolved = dict(cache["resolved"])
+            print(f"bootstrap > reusing resolved agent {resolved['agent_name']} (id: {resolved['agent_id']})")
+        else:
+            resolved = resolve_agent(project_client, agent_name, bing_connection_name, vector_store_name)
+            cache = {"key": key, "resolved": dict(resolved), "resolved_at": time.time()}
+
+        # Model and instructions as they are now, never from the cache
+        agent = project_client.agents.get_agent(resolved["agent_id"])
+        resolved.update(model=agent.model, instructions=agent.instructions)
+
+        toolset = build_toolset(resolved)
+        config_hash = agent_config_hash(resolved["model"], resolved["instructions"], toolset)
+        if fresh and cache.get("applied_hash") == config_hash:
+            print("bootstrap > agent tools unchanged, skipping update_agent")
+        else:
+            update_agent(resolved, toolset)
+            cache["applied_hash"] = config_hash
+        _write_cache(cache_path, cache)
+    return resolved, toolset
@@ -0,0 +1,170 @@
+"""
+Prometheus metrics for the agent web app, served at /metrics.
+
+Stream metrics are fed from the event handlers (one StreamMetrics per create_stream),
+tool latency from the toolsets, the active-stream gauge from the chat handlers and the
+admission metrics from the admission controller.
+Under gunicorn, set PROMETHEUS_MULTIPROC_DIR (start.sh does) so /metrics aggregates
+every worker instead of whichever one happened to serve the scrape.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60, 120)
+
+TIME_TO_FIRST_TOKEN = Histogram(
+    "agent_time_to_first_token_seconds",
+    "Time from starting a run's stream to the first streamed text token.",
+    buckets=_LATENCY_BUCKETS,
+)
+RESPONSE_SECONDS = Histogram(
+    "agent_response_seconds",
+    "Time from starting a run's stream to the run completing.",
+    buckets=_LATENCY_BUCKETS,
+)
+TOKENS_PER_SECOND = Histogram(
+    "agent_tokens_per_second",
+    "Completion tokens per second, measured from the first streamed token to completion.",
+    buckets=(5, 10, 20, 30, 40, 60, 80, 120, 160, 240),
+)
+PROMPT_TOKENS = Histogram(
+    "agent_prompt_tokens",
+    "Prompt tokens used by a completed run (bounded by the context window settings).",
+    buckets=(500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000),
+)
+RUN_QUEUE_WAIT = Histogram(
+    "agent_run_queue_wait_seconds",
+    "Time a run spent queued before the service started (or resumed) it.",
+    buckets=_LATENCY_BUCKETS,
+)
+TOOL_SECONDS = Histogram(
+    "agent_tool_seconds",
+    "Local function tool execution time.",
+    ["function"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+ACTIVE_STREAMS = Gauge(
+    "agent_active_streams",
+    "Chat responses currently streaming.",
+    multiprocess_mode="livesum",
+)
+ERRORS = Counter(
+    "agent_errors_total",
+    "Errors by kind: stream, run_failed/run_cancelled/run_expired/run_incomplete, tool.",
+    ["kind"],
+)
+
+ADMISSION_WAIT = Histogram(
+    "agent_admission_wait_seconds",
+    "Time a chat request waited in the admission queue before it was admitted.",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+ADMISSION_REJECTED = Counter(
+    "agent_admission_rejected_total",
+    "Chat requests turned away, by reason: queue_full, queue_timeout (busy) or draining (server restarting).",
+    ["reason"],
+)
+TOOL_PREFETCH = Counter(
+    "agent_tool_prefetch_total",
+    "Speculative tool prefetches by outcome: started, hit, wasted; miss counts unpredicted calls.",
+    ["function", "outcome"],
+)
+
+_FAILED_RUN_STATUSES = {"failed", "cancelled", "expired", "incomplete"}
+
+
+class StreamMetrics:
+    """Per-stream timings, fed by the event handler callbacks."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self._queued_at: Optional[float] = None
+        self._finished = False
+
+    def on_token(self) -> None:
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            TIME_TO_FIRST_TOKEN.observe(self.first_token_at - self.started)
+
+    def on_run_status(self, run: Any) -> None:
+        status = str(getattr(run.status, "value", run.status))
+        now = time.perf_counter()
+        if status == "queued":
+            self._queued_at = now
+        elif status == "in_progress" and self._queued_at is not None:
+            RUN_QUEUE_WAIT.observe(now - self._queued_at)
+            self._queued_at = None
+        elif status == "completed":
+            self._finish(getattr(run, "usage", None))
+        elif status in _FAILED_RUN_STATUSES:
+            ERRORS.labels(kind=f"run_{status}").inc()
+            self._finish(None)
+
+    def on_error(self) -> None:
+        ERRORS.labels(kind="stream").inc()
+
+    def _finish(self, usage: Any) -> None:
+        if self._finished:
+            return
+        self._finished = True
+        now = time.perf_counter()
+        RESPONSE_SECONDS.observe(now - self.started)
+        prompt_tokens = getattr(usage, "prompt_tokens", None) if usage else None
+        if prompt_tokens:
+            PROMPT_TOKENS.observe(prompt_tokens)
+        completion_tokens = getattr(usage, "completion_tokens", None) if usage else None
+        if completion_tokens and self.first_token_at is not None and now > self.first_token_at:
+            TOKENS_PER_SECOND.observe(completion_tokens / (now - self.first_token_at))
+
+
+def observe_tool(fn_name: str, seconds: float, output: Any = None, failed: bool = False) -> None:
+    TOOL_SECONDS.labels(function=fn_name).observe(seconds)
+    # The tools report problems as {"error": ...} results rather than raising
+    if failed or (isinstance(output, str) and output.startswith('{"error"')):
+        ERRORS.labels(kind="tool").inc()
+
+
+def observe_admission(wait_seconds: float) -> None:
+    ADMISSION_WAIT.observe(wait_seconds)
+
+
+def count_rejection(reason: str) -> None:
+    ADMISSION_REJECTED.labels(reason=reason.replace(" ", "_")).inc()
+
+
+def count_prefetch(fn_name: str, outcome: str) -> None:
+    TOOL_PREFETCH.labels(function=fn_name, outcome=outcome).inc()
+
+
+@contextmanager
+def active_stream() -> Iterator[None]:
+    ACTIVE_STREAMS.inc()
+    try:
+        yield
+    except Exception:
+        ERRORS.labels(kind="stream").inc()
+        raise
+    finally:
+        ACTIVE_STREAMS.dec()
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Returns (body, content type) for the /metrics endpoint."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,91 @@
+"""
+Bounded run context for long-lived session threads.
+
+A session keeps one service thread for as long as the user stays, and by default every
+run reads the entire thread, so prompt tokens and latency climb with each turn. These
+settings bound what a run sees when it is created:
+
+    CONTEXT_LAST_MESSAGES=20        runs only read the last N thread messages (0 = whole thread)
+    CONTEXT_MAX_PROMPT_TOKENS=0     prompt token budget per run, truncated by the service (0 = none)
+    CONTEXT_SUMMARY=false           recap the messages that fell out of the window
+    CONTEXT_SUMMARY_MAX_CHARS=1500  size of that recap
+
+The recap is extractive (the opening of each older message, newest first, until the
+budget is used), so it costs no extra model call; it is built from the session's
+display transcript and passed to the run as additional instructions.
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from azure.ai.projects.models import TruncationObject, TruncationStrategy
+
+CONTEXT_LAST_MESSAGES = int(os.getenv("CONTEXT_LAST_MESSAGES", "20"))
+CONTEXT_MAX_PROMPT_TOKENS = int(os.getenv("CONTEXT_MAX_PROMPT_TOKENS", "0"))
+CONTEXT_SUMMARY = os.getenv("CONTEXT_SUMMARY", "false").lower() in ("1", "true", "yes")
+CONTEXT_SUMMARY_MAX_CHARS = int(os.getenv("CONTEXT_SUMMARY_MAX_CHARS", "1500"))
+
+_MESSAGE_EXCERPT_CHARS = 200
+
+
+def run_context_options(
+    last_messages: int = CONTEXT_LAST_MESSAGES, max_prompt_tokens: int = CONTEXT_MAX_PROMPT_TOKENS
+) -> Dict[str, Any]:
+    """create_stream keyword arguments that bound the context a run reads."""
+    options: Dict[str, Any] = {}
+    if last_messages > 0:
+        options["truncation_strategy"] = TruncationObject(
+            type=TruncationStrategy.LAST_MESSAGES, last_messages=last_messages
+        )
+    elif max_prompt_tokens > 0:
+        options["truncation_strategy"] = TruncationObject(type=TruncationStrategy.AUTO)
+    if max_prompt_tokens > 0:
+        options["max_prompt_tokens"] = max_prompt_tokens
+    return options
+
+
+def _excerpt(text: str) -> str:
+    text = " ".join(text.split())
+    first_sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    if len(first_sentence) > _MESSAGE_EXCERPT_CHARS:
+        first_sentence = first_sentence[:_MESSAGE_EXCERPT_CHARS].rstrip() + "..."
+    return first_sentence
+
+
+def summarize_dropped_turns(
+    transcript: List[Any],
+    last_messages: int = CONTEXT_LAST_MESSAGES,
+    max_chars: int = CONTEXT_SUMMARY_MAX_CHARS,
+) -> Optional[str]:
+    """
+    Recap of the user/assistant messages in `transcript` (ChatMessage bubbles, newest last)
+    that are older than the last `last_messages`, or None when nothing was dropped. Tool
+    bubbles are skipped, as they are run steps rather than thread messages. Only the tail of
+    the transcript is walked, so the cost is bounded by `max_chars`, not the session length.
+    """
+    if last_messages <= 0:
+        return None
+    kept = 0
+    lines: List[str] = []
+    used = 0
+    omitted = False
+    for message in reversed(transcript):
+        if message.metadata or not isinstance(message.content, str):
+            continue
+        if kept < last_messages:
+            kept += 1
+            continue
+        line = f"- {message.role}: {_excerpt(message.content)}"
+        if used + len(line) > max_chars:
+            omitted = True
+            break
+        lines.append(line)
+        used += len(line) + 1
+    if not lines:
+        return None
+    recap = "\n".join(reversed(lines))
+    if omitted:
+        recap = "- (earlier messages omitted)\n" + recap
+    return (
+        "Earlier in this conversation (older messages are no longer in your context):\n" + recap
+    )
@@ -92,8 +92,15 @@ which pip
 echo "Installing packages..."
 pip install --no-cache-dir -r /home/site/wwwroot/requirements.txt || { echo "Pip install failed"; exit 1; }
 
+# Shared directory so /metrics aggregates all gunicorn workers (cleared on every start)
+export PROMETHEUS_MULTIPROC_DIR=/tmp/prometheus_multiproc
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+# Tool caches (geocodes, forecasts, price history) shared by all gunicorn workers
+export TOOL_CACHE_BACKEND="${TOOL_CACHE_BACKEND:-sqlite}"
+
 echo "Starting Gunicorn..."
-gunicorn -w 4 -k uvicorn.workers.UvicornWorker main:app --bind 0.0.0.0:8000 --log-level debug
+gunicorn -w 4 -k uvicorn.workers.UvicornWorker main:app --bind 0.0.0.0:8000 --graceful-timeout 45 --log-level debug
 EOF
 
 # Ensure the startup script has execution permissions
@@ -111,9 +118,12 @@ cd /home/dhangerkapil/azure-ai-agent-service-enterprise-demo/azure || { echo "Di
 # Remove any old ZIP file
 rm -f app.zip
 
+# Bundle the policy documents for the local policy index (policy_index.py)
+[ -d enterprise-data ] || cp -r ../../enterprise-data . || echo "enterprise-data not found; the local policy index will be empty"
+
 # Create a ZIP file of the application code (this includes start.sh)
 echo "Creating ZIP file for deployment..."
-zip -r app.zip main.py enterprise_functions.py requirements.txt start.sh .env
+zip -r app.zip main.py enterprise_functions.py enterprise_functions_aio.py tool_output_budget.py single_flight.py session_threads.py agent_bootstrap.py agent_metrics.py admission.py event_log.py policy_index.py tool_prefetch.py tool_cache.py context_window.py enterprise-data requirements.txt start.sh .env
 
 # Verify that the ZIP file was created
 if [ ! -f app.zip ]; then
@@ -1,12 +1,218 @@
 import os
 import json
+import math
+import threading
+import time
 import requests
-from datetime import datetime as pydatetime, timedelta, timezone
-from typing import Optional, Callable, Any, Set
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import InvalidHeader
+from urllib3.util.retry import Retry
+from datetime import datetime as pydatetime, time as dtime, timedelta, timezone
+from typing import Optional, Callable, Any, Dict, Generator, List, Set, Tuple
+from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
 
+from policy_index import policy_index
+from tool_cache import tool_cache
+
 load_dotenv(override=True)
 
+
+# One pooled, keep-alive HTTP session shared by every tool call. Each upstream host gets its
+# own connection pool, every request is bounded by connect/read timeouts, and idempotent GETs
+# are retried a bounded number of times (POSTs such as send_email are never retried).
+HTTP_CONNECT_TIMEOUT = float(os.getenv("ENTERPRISE_HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("ENTERPRISE_HTTP_READ_TIMEOUT", "15"))
+HTTP_POOL_MAXSIZE = int(os.getenv("ENTERPRISE_HTTP_POOL_MAXSIZE", "16"))
+HTTP_GET_RETRIES = int(os.getenv("ENTERPRISE_HTTP_GET_RETRIES", "2"))
+# A 429/503 Retry-After is honoured, but a retry never waits longer than this
+HTTP_RETRY_AFTER_MAX_SECONDS = float(os.getenv("ENTERPRISE_HTTP_RETRY_AFTER_MAX_SECONDS", "5"))
+
+
+# Statuses worth retrying on an idempotent GET (rate limiting and transient server errors).
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class _CappedRetry(Retry):
+    """Retry whose Retry-After waits are capped at HTTP_RETRY_AFTER_MAX_SECONDS."""
+
+    def parse_retry_after(self, retry_after: str) -> float:
+        return min(super().parse_retry_after(retry_after), HTTP_RETRY_AFTER_MAX_SECONDS)
+
+
+def _retry_after_seconds(status_code: int, retry_after: Optional[str]) -> Optional[float]:
+    """The wait _CappedRetry takes from a response's Retry-After header, if it applies."""
+    if not retry_after or status_code not in Retry.RETRY_AFTER_STATUS_CODES:
+        return None
+    try:
+        return _CappedRetry(total=0).parse_retry_after(retry_after)
+    except InvalidHeader:
+        return None
+
+
+def _build_http_session() -> requests.Session:
+    retry = _CappedRetry(
+        total=HTTP_GET_RETRIES,
+        backoff_factor=0.3,
+        status_forcelist=_RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_http_session = _build_http_session()
+
+# Tools that call upstream services are written as generators of request steps: each step
+# yields (method, url, kwargs) and receives the response, and the generator's return value is
+# the tool's JSON result. The blocking driver below and the asyncio driver in
+# enterprise_functions_aio.py run the same steps, so both variants share one implementation.
+HttpStep = Tuple[str, str, Dict[str, Any]]
+HttpSteps = Generator[HttpStep, Any, str]
+
+
+def _http_request(method: str, url: str, **kwargs: Any) -> requests.Response:
+    kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    return _http_session.request(method, url, **kwargs)
+
+
+def _run_http_steps(steps: HttpSteps) -> str:
+    """Runs a tool's request steps on the shared blocking session and returns its result."""
+    try:
+        method, url, kwargs = next(steps)
+        while True:
+            try:
+                response = _http_request(method, url, **kwargs)
+            except Exception as e:
+                method, url, kwargs = steps.throw(e)
+            else:
+                method, url, kwargs = steps.send(response)
+    except StopIteration as done:
+        return done.value
+    finally:
+        # Cancelled or interrupted mid-request: close the steps so their breaker probe is released
+        steps.close()
+
+# Per-dependency circuit breakers. After CIRCUIT_FAILURE_THRESHOLD consecutive failures
+# (transport errors, 429 or 5xx) a dependency is "open" and calls to it fail fast with a
+# structured error; after CIRCUIT_RESET_SECONDS a single half-open probe is let through,
+# which either closes the circuit again or re-opens it for another period.
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, dependency: str, retry_after: float):
+        super().__init__(f"{dependency} is temporarily unavailable (circuit open)")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+    def to_result(self) -> Dict[str, Any]:
+        return {
+            "error": f"{self.dependency} is temporarily unavailable; the call was skipped.",
+            "dependency": self.dependency,
+            "circuit": "open",
+            "retry_after_seconds": round(self.retry_after, 1),
+        }
+
+
+class _CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self._reset_seconds:
+                return "half_open"
+            return "open"
+
+    def before_call(self) -> None:
+        """Raises CircuitOpenError unless the call may go ahead (closed, or the half-open probe)."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            waited = time.monotonic() - self._opened_at
+            if waited >= self._reset_seconds and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            raise CircuitOpenError(self.name, max(0.0, self._reset_seconds - waited))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probe_in_flight or self._failures >= self._failure_threshold:
+                if self._opened_at is None:
+                    print(f"circuit > {self.name} open after {self._failures} failures")
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Frees the half-open probe of an abandoned call without counting it as a failure."""
+        with self._lock:
+            self._probe_in_flight = False
+
+
+_breakers: Dict[str, _CircuitBreaker] = {
+    name: _CircuitBreaker(name, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+    for name in ("openweather", "yahoo_finance", "logic_app")
+}
+
+
+def _guarded_request(dependency: str, step: HttpStep) -> Generator[HttpStep, Any, Any]:
+    """Request step wrapped in the dependency's circuit breaker (use with `yield from`)."""
+    breaker = _breakers[dependency]
+    breaker.before_call()
+    try:
+        response = yield step
+    except Exception:
+        breaker.record_failure()
+        raise
+    except BaseException:
+        # Abandoned call (GeneratorExit, cancellation): says nothing about the dependency
+        breaker.release_probe()
+        raise
+    if response.status_code in _RETRY_STATUSES:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+
+# The One Call forecast is published in hourly slots (current + 48 hourly + 8 daily entries).
+# A downloaded forecast stays valid until the next slot boundary; geocodes barely change.
+_FORECAST_SLOT_SECONDS = 60 * 60
+_GEOCODE_TTL_SECONDS = 24 * 60 * 60
+_COORD_PRECISION = 2  # ~1 km, so nearby geocodes share one forecast
+
+_geocode_cache = tool_cache("geocode")
+_forecast_cache = tool_cache("forecast")
+
+
+def _next_slot_boundary(now: float, slot_seconds: int) -> float:
+    """Returns the epoch time at which the provider's current forecast slot ends."""
+    return (math.floor(now / slot_seconds) + 1) * slot_seconds
+
+
 def fetch_datetime(
     format_str: str = "%Y-%m-%d %H:%M:%S",
     unix_ts: int | None = None,
@@ -60,6 +266,21 @@ def fetch_weather(
     :param dt_unix: A Unix timestamp, required if timeframe='timemachine'.
     :return: A JSON string containing weather data or an "error" key if an issue.
     """
+    return _run_http_steps(_fetch_weather_steps(
+        location, country_code, state_code, limit, timeframe, time_offset, dt_unix
+    ))
+
+
+def _fetch_weather_steps(
+    location: str,
+    country_code: str = "",
+    state_code: str = "",
+    limit: int = 1,
+    timeframe: str = "current",
+    time_offset: int = 0,
+    dt_unix: Optional[int] = None
+) -> HttpSteps:
+    """Request steps behind :func:`fetch_weather`."""
     try:
         if not location:
             return json.dumps({"error": "Missing required parameter: location"})
@@ -77,19 +298,25 @@ def fetch_weather(
         else:
             query = location
 
-        geocode_url = (
-            f"http://api.openweathermap.org/geo/1.0/direct?"
-            f"q={query}&limit={limit}&appid={geo_api_key}"
-        )
-        geo_resp = requests.get(geocode_url)
-        if geo_resp.status_code != 200:
-            return json.dumps({
-                "error": "Geocoding request failed",
-                "status_code": geo_resp.status_code,
-                "details": geo_resp.text
-            })
+        geocode_key = (query.lower(), limit)
+        geocode_data = _geocode_cache.get(geocode_key)
+        if geocode_data is None:
+            geocode_url = (
+                f"http://api.openweathermap.org/geo/1.0/direct?"
+                f"q={query}&limit={limit}&appid={geo_api_key}"
+            )
+            geo_resp = yield from _guarded_request("openweather", ("GET", geocode_url, {}))
+            if geo_resp.status_code != 200:
+                return json.dumps({
+                    "error": "Geocoding request failed",
+                    "status_code": geo_resp.status_code,
+                    "details": geo_resp.text
+                })
+
+            geocode_data = geo_resp.json()
+            if geocode_data:
+                _geocode_cache.set(geocode_key, geocode_data, time.time() + _GEOCODE_TTL_SECONDS)
 
-        geocode_data = geo_resp.json()
         if not geocode_data:
             return json.dumps({"error": f"No geocoding results for '{location}'."})
 
@@ -99,6 +326,8 @@ def fetch_weather(
             return json.dumps({"error": "No valid lat/long returned."})
 
         tf = timeframe.lower()
+        forecast_key = None
+        data = None
         if tf == "timemachine":
             if dt_unix is None:
                 return json.dumps({
@@ -122,32 +351,32 @@ def fetch_weather(
                 f"&appid={one_api_key}"
             )
         else:
-            if tf == "current":
-                exclude = "minutely,hourly,daily,alerts"
-            elif tf == "hourly":
-                exclude = "minutely,daily,alerts"
-            elif tf == "daily":
-                exclude = "minutely,hourly,alerts"
-            else:
-                exclude = ""
-
+            # current, hourly and daily are all served from one cached One Call payload,
+            # so only minutely data and alerts are excluded from the download.
+            forecast_key = (round(lat, _COORD_PRECISION), round(lon, _COORD_PRECISION))
+            data = _forecast_cache.get(forecast_key)
             url = (
                 f"https://api.openweathermap.org/data/3.0/onecall?"
-                f"lat={lat}&lon={lon}"
-                f"&exclude={exclude}"
+                f"lat={forecast_key[0]}&lon={forecast_key[1]}"
+                f"&exclude=minutely,alerts"
                 f"&units=metric"
                 f"&appid={one_api_key}"
             )
 
-        resp = requests.get(url)
-        if resp.status_code != 200:
-            return json.dumps({
-                "error": "Weather API failed",
-                "status_code": resp.status_code,
-                "details": resp.text
-            })
+        if data is None:
+            resp = yield from _guarded_request("openweather", ("GET", url, {}))
+            if resp.status_code != 200:
+                return json.dumps({
+                    "error": "Weather API failed",
+                    "status_code": resp.status_code,
+                    "details": resp.text
+                })
 
-        data = resp.json()
+            data = resp.json()
+            if forecast_key is not None and data.get("current"):
+                _forecast_cache.set(
+                    forecast_key, data, _next_slot_boundary(time.time(), _FORECAST_SLOT_SECONDS)
+                )
         if tf == "overview":
             overview = data.get("weather_overview", "No overview text provided.")
             return json.dumps({
@@ -207,16 +436,139 @@ def fetch_weather(
             "humidity_percent": humidity,
         }
         return json.dumps(result)
+    except CircuitOpenError as e:
+        return json.dumps(e.to_result())
     except Exception as e:
         return json.dumps({"error": f"Exception occurred: {str(e)}"})
 
 
+# Quotes only move while the exchange is open: cache briefly during the session, and until
+# the next open otherwise (exchange holidays simply cost one extra download at 09:30).
+_MARKET_TZ = ZoneInfo("America/New_York")
+_MARKET_OPEN = dtime(9, 30)
+_MARKET_CLOSE = dtime(16, 0)
+STOCK_OPEN_TTL_SECONDS = int(os.getenv("STOCK_OPEN_TTL_SECONDS", "60"))
+# Compacted stock results are kept under this many characters of JSON.
+STOCK_RESULT_MAX_CHARS = int(os.getenv("STOCK_RESULT_MAX_CHARS", "4000"))
+
+_stock_cache = tool_cache("stock_history", max_entries=256)
+
+
+def _stock_cache_expiry(now: float) -> float:
+    """Returns when cached price history fetched at `now` stops being current."""
+    local_now = pydatetime.fromtimestamp(now, _MARKET_TZ)
+    if local_now.weekday() < 5 and _MARKET_OPEN <= local_now.time() < _MARKET_CLOSE:
+        return now + STOCK_OPEN_TTL_SECONDS
+
+    day = local_now.date()
+    if local_now.weekday() >= 5 or local_now.time() >= _MARKET_CLOSE:
+        day += timedelta(days=1)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return pydatetime.combine(day, _MARKET_OPEN, tzinfo=_MARKET_TZ).timestamp()
+
+
+def _stock_records_from_history(stock_data: Any) -> List[Dict[str, Any]]:
+    """Converts a yfinance history DataFrame into JSON-ready row dicts."""
+    stock_data = stock_data.copy()
+    # Intraday intervals index by "Datetime" rather than "Date".
+    stock_data.index.name = "Date"
+    stock_data.reset_index(inplace=True)
+    stock_data['Date'] = stock_data['Date'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    # Gaps become null; NaN is not valid JSON
+    stock_data = stock_data.astype(object).where(stock_data.notna(), None)
+    return stock_data.to_dict(orient="records")
+
+
+# Columns of Ticker.history(); rows from yf.download are reshaped to match before they are
+# cached, since fetch_stock_price and fetch_stock_prices share cache entries.
+_HISTORY_COLUMNS = ["Open", "High", "Low", "Close", "Volume", "Dividends", "Stock Splits"]
+
+
+def _history_from_download(stock_data: Any) -> Any:
+    """One symbol's slice of a yf.download frame in Ticker.history's shape, without price-less rows."""
+    stock_data = stock_data.dropna(subset=["Close"])
+    stock_data = stock_data[[c for c in _HISTORY_COLUMNS if c in stock_data.columns]]
+    if "Volume" in stock_data.columns and stock_data["Volume"].notna().all():
+        stock_data = stock_data.astype({"Volume": "int64"})
+    return stock_data
+
+
+def _stock_summary(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Summary statistics for a price history."""
+    closes = [r["Close"] for r in records if isinstance(r.get("Close"), (int, float))]
+    volumes = [r["Volume"] for r in records if isinstance(r.get("Volume"), (int, float))]
+    summary: Dict[str, Any] = {
+        "rows": len(records),
+        "first_date": records[0].get("Date"),
+        "last_date": records[-1].get("Date"),
+    }
+    if closes:
+        summary.update({
+            "first_close": round(closes[0], 4),
+            "last_close": round(closes[-1], 4),
+            "change": round(closes[-1] - closes[0], 4),
+            "change_percent": round((closes[-1] - closes[0]) / closes[0] * 100, 2) if closes[0] else None,
+            "high": round(max(r.get("High", c) for r, c in zip(records, closes)), 4),
+            "low": round(min(r.get("Low", c) for r, c in zip(records, closes)), 4),
+            "mean_close": round(sum(closes) / len(closes), 4),
+        })
+    if volumes:
+        summary["average_volume"] = int(sum(volumes) / len(volumes))
+    return summary
+
+
+def _downsample_indexes(length: int, fits: Callable[[List[int]], bool]) -> List[int]:
+    """
+    Picks evenly spaced positions out of `length` (always keeping the first and last),
+    halving the count until `fits` accepts them.
+    """
+    points = length
+    while True:
+        if points <= 1:
+            return [length - 1]
+        step = (length - 1) / (points - 1)
+        indexes = [round(i * step) for i in range(points)]
+        if fits(indexes):
+            return indexes
+        points //= 2
+
+
+def _compact_stock_records(records: List[Dict[str, Any]], max_chars: int) -> Dict[str, Any]:
+    """
+    Summarizes price history as statistics plus an evenly downsampled series whose JSON
+    fits within max_chars.
+    """
+    summary = _stock_summary(records)
+
+    # Dividends / Stock Splits are almost always zero; only keep them when they carry data.
+    columns = [
+        k for k in records[0]
+        if k not in ("Dividends", "Stock Splits") or any(r.get(k) for r in records)
+    ]
+    rows = [
+        {k: round(r[k], 4) if isinstance(r.get(k), float) else r.get(k) for k in columns}
+        for r in records
+    ]
+
+    budget = max_chars - len(json.dumps(summary))
+    indexes = _downsample_indexes(
+        len(rows), lambda idx: len(json.dumps([rows[i] for i in idx])) <= budget
+    )
+    return {
+        "summary": summary,
+        "data": [rows[i] for i in indexes],
+        "downsampled": len(indexes) < len(rows),
+    }
+
+
 def fetch_stock_price(
     ticker_symbol: str,
     period: str = "1d",
     interval: str = "1d",
     start: Optional[str] = None,
-    end: Optional[str] = None
+    end: Optional[str] = None,
+    compact: bool = True
 ) -> str:
     """
     Fetch stock price info for a given ticker symbol, with optional historical data.
@@ -226,23 +578,158 @@ def fetch_stock_price(
     :param interval: The granularity of data, e.g. "1d", "1h".
     :param start: (optional) The start date/time in YYYY-MM-DD or YYYY-MM-DD HH:MM:SS format.
     :param end: (optional) The end date/time in similar format.
+    :param compact: (optional) If true (default), long histories are returned as summary statistics plus a downsampled series; set false to get every row.
     :return: A JSON string containing stock data or an "error" message.
     """
     import yfinance as yf
     try:
-        stock = yf.Ticker(ticker_symbol)
-        stock_data = stock.history(period=period, interval=interval, start=start, end=end)
-        if stock_data.empty:
-            return json.dumps({"error": f"No data found for symbol: {ticker_symbol}"})
+        cache_key = (ticker_symbol.upper(), period, interval, start, end)
+        data_records = _stock_cache.get(cache_key)
+        if data_records is None:
+            breaker = _breakers["yahoo_finance"]
+            breaker.before_call()
+            try:
+                stock = yf.Ticker(ticker_symbol)
+                stock_data = stock.history(period=period, interval=interval, start=start, end=end)
+            except Exception:
+                breaker.record_failure()
+                raise
+            except BaseException:
+                breaker.release_probe()
+                raise
+            # Yahoo answered; an empty frame just means the symbol/range has no data.
+            breaker.record_success()
+            if stock_data.empty:
+                return json.dumps({"error": f"No data found for symbol: {ticker_symbol}"})
 
-        stock_data.reset_index(inplace=True)
-        stock_data['Date'] = stock_data['Date'].dt.strftime('%Y-%m-%d %H:%M:%S')
-        data_records = stock_data.to_dict(orient="records")
+            data_records = _stock_records_from_history(stock_data)
+            _stock_cache.set(cache_key, data_records, _stock_cache_expiry(time.time()))
+
+        if compact:
+            return json.dumps({
+                "ticker_symbol": ticker_symbol.upper(),
+                **_compact_stock_records(data_records, STOCK_RESULT_MAX_CHARS)
+            })
 
         return json.dumps({
             "ticker_symbol": ticker_symbol.upper(),
             "data": data_records
         })
+    except CircuitOpenError as e:
+        return json.dumps(e.to_result())
+    except (KeyError, ValueError) as e:
+        return json.dumps({"error": f"Invalid or missing data: {e}"})
+    except Exception as e:
+        return json.dumps({"error": f"Unexpected issue - {type(e).__name__}: {e}"})
+
+
+def fetch_stock_prices(
+    ticker_symbols: List[str],
+    period: str = "1d",
+    interval: str = "1d",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    compact: bool = True
+) -> str:
+    """
+    Fetch stock price info for several ticker symbols in one call, aligned by date (use this to compare stocks).
+
+    :param ticker_symbols: The ticker symbols to look up, e.g. ["GOOGL", "AMZN"].
+    :param period: Over what period to pull data, e.g. "1d", "1mo", "1y".
+    :param interval: The granularity of data, e.g. "1d", "1h".
+    :param start: (optional) The start date/time in YYYY-MM-DD or YYYY-MM-DD HH:MM:SS format.
+    :param end: (optional) The end date/time in similar format.
+    :param compact: (optional) If true (default), returns per-symbol summary statistics plus an aligned, downsampled close-price series; set false to get every row per symbol.
+    :return: A JSON string containing stock data per symbol or an "error" message.
+    """
+    import yfinance as yf
+    try:
+        symbols = list(dict.fromkeys(s.strip().upper() for s in ticker_symbols or [] if s and s.strip()))
+        if not symbols:
+            return json.dumps({"error": "Missing required parameter: ticker_symbols"})
+
+        # Shares cache entries with fetch_stock_price; only the misses are downloaded, together.
+        records_by_symbol: Dict[str, List[Dict[str, Any]]] = {}
+        missing = []
+        for symbol in symbols:
+            cached = _stock_cache.get((symbol, period, interval, start, end))
+            if cached is None:
+                missing.append(symbol)
+            else:
+                records_by_symbol[symbol] = cached
+
+        if missing:
+            breaker = _breakers["yahoo_finance"]
+            breaker.before_call()
+            try:
+                history = yf.download(
+                    missing, period=period, interval=interval, start=start, end=end,
+                    group_by="ticker", progress=False, threads=True,
+                    # Same adjustment and columns as Ticker.history
+                    auto_adjust=True, actions=True,
+                )
+            except Exception:
+                breaker.record_failure()
+                raise
+            except BaseException:
+                breaker.release_probe()
+                raise
+            breaker.record_success()
+            expires_at = _stock_cache_expiry(time.time())
+            for symbol in missing:
+                if history is None or history.empty or symbol not in history.columns.get_level_values(0):
+                    continue
+                stock_data = _history_from_download(history[symbol])
+                if stock_data.empty:
+                    continue
+                records = _stock_records_from_history(stock_data)
+                _stock_cache.set((symbol, period, interval, start, end), records, expires_at)
+                records_by_symbol[symbol] = records
+
+        errors = {s: "No data found" for s in symbols if s not in records_by_symbol}
+        found = [s for s in symbols if s in records_by_symbol]
+        if not found:
+            return json.dumps({"error": f"No data found for symbols: {', '.join(symbols)}"})
+
+        if not compact:
+            result: Dict[str, Any] = {
+                "ticker_symbols": found,
+                "data": {s: records_by_symbol[s] for s in found},
+            }
+        else:
+            # Align closes on the union of dates so each row compares the symbols side by side.
+            closes = {
+                s: {r["Date"]: r.get("Close") for r in records_by_symbol[s]} for s in found
+            }
+            dates = sorted(set().union(*(c.keys() for c in closes.values())))
+            summary = {s: _stock_summary(records_by_symbol[s]) for s in found}
+
+            def series_for(indexes: List[int]) -> Dict[str, Any]:
+                picked = [dates[i] for i in indexes]
+                series: Dict[str, Any] = {"Date": picked}
+                for s in found:
+                    series[s] = [
+                        round(closes[s][d], 4) if isinstance(closes[s].get(d), float) else closes[s].get(d)
+                        for d in picked
+                    ]
+                return series
+
+            budget = STOCK_RESULT_MAX_CHARS - len(json.dumps(summary))
+            indexes = _downsample_indexes(
+                len(dates), lambda idx: len(json.dumps(series_for(idx))) <= budget
+            )
+            result = {
+                "ticker_symbols": found,
+                "summary": summary,
+                "close": series_for(indexes),
+                "downsampled": len(indexes) < len(dates),
+            }
+
+        if errors:
+            result["errors"] = errors
+        return json.dumps(result)
+    except CircuitOpenError as e:
+        return json.dumps(e.to_result())
     except (KeyError, ValueError) as e:
         return json.dumps({"error": f"Invalid or missing data: {e}"})
     except Exception as e:
@@ -272,10 +759,29 @@ def send_email(recipient: str, subject: str, body: str) -> str:
     except Exception as e:
         return json.dumps({"error": f"Failed to send email: {e}"})
     
+def search_policies(query: str, top_k: int = 3) -> str:
+    """
+    Searches the company policy documents (HR, vacation, remote work, reviews, conduct).
+
+    Uses a local index over enterprise-data and returns the best matching sections.
+
+    :param query: The policy question or keywords, e.g. "vacation days per year".
+    :param top_k: How many sections to return (1-5).
+    :return: A JSON string with the matching "results" (source, section, text, score) or an "error" key/value.
+    """
+    try:
+        results = policy_index.search(query, max(1, min(int(top_k), 5)))
+        return json.dumps({"query": query, "results": results})
+    except Exception as e:
+        return json.dumps({"error": f"Policy search failed: {e}"})
+
+
 # make functions callable a callable set from enterprise-streaming-agent.ipynb
 enterprise_fns: Set[Callable[..., Any]] = {
     fetch_datetime,
     fetch_weather,
     fetch_stock_price,
-    send_email
+    fetch_stock_prices,
+    send_email,
+    search_policies
 }
\ No newline at end of file
@@ -0,0 +1,180 @@
+"""
+Asyncio counterparts of the tools in enterprise_functions.py.
+
+Each function keeps the name, signature, docstring and JSON return contract of its
+blocking twin, so `enterprise_fns` here can be handed to an AsyncFunctionTool in place
+of the sync set. Weather runs the same request steps as the sync tool, just on a
+non-blocking httpx client (its cache accesses go to a worker thread); yfinance has no
+async API, so stock lookups are offloaded to a worker thread, and the mock send_email
+does no I/O at all.
+"""
+import asyncio
+import weakref
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+import httpx
+
+import enterprise_functions as _sync
+from enterprise_functions import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    HTTP_POOL_MAXSIZE,
+    HTTP_GET_RETRIES,
+    HttpSteps,
+    _RETRY_STATUSES,
+    _retry_after_seconds,
+)
+
+# httpx clients are bound to the event loop they were first used on, so keep one per loop.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=None,
+                max_keepalive_connections=HTTP_POOL_MAXSIZE,
+            ),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def _http_request(method: str, url: str, **kwargs: Any) -> httpx.Response:
+    """Mirrors the sync session: bounded retries with backoff (or a capped Retry-After) for GET/HEAD only."""
+    attempts = 1 + (HTTP_GET_RETRIES if method in ("GET", "HEAD") else 0)
+    for attempt in range(attempts):
+        last_attempt = attempt == attempts - 1
+        try:
+            response = await _get_client().request(method, url, **kwargs)
+        except httpx.TransportError:
+            if last_attempt:
+                raise
+            retry_after = None
+        else:
+            if last_attempt or response.status_code not in _RETRY_STATUSES:
+                return response
+            retry_after = _retry_after_seconds(response.status_code, response.headers.get("Retry-After"))
+        # Same waits as the sync session: a capped Retry-After, else exponential backoff
+        await asyncio.sleep(retry_after or 0.3 * (2 ** attempt))
+
+
+def _resume(resume: Callable[..., Any], *args: Any) -> Tuple[bool, Any]:
+    """Runs request steps up to their next request: (finished, next step or tool result)."""
+    try:
+        return False, resume(*args)
+    except StopIteration as done:
+        return True, done.value
+
+
+async def _run_http_steps(steps: HttpSteps) -> str:
+    """
+    Runs a tool's request steps on the shared async client and returns its result. Between
+    requests the steps read and write the tool caches, which may be SQLite or Redis,
+    so that part runs in a worker thread instead of on the event loop.
+    """
+    advance = asyncio.ensure_future(asyncio.to_thread(_resume, next, steps))
+    try:
+        while True:
+            # shield: a step already running in its thread cannot be interrupted anyway
+            finished, step = await asyncio.shield(advance)
+            if finished:
+                return step
+            method, url, kwargs = step
+            try:
+                response = await _http_request(method, url, **kwargs)
+            except Exception as e:
+                advance = asyncio.ensure_future(asyncio.to_thread(_resume, steps.throw, e))
+            else:
+                advance = asyncio.ensure_future(asyncio.to_thread(_resume, steps.send, response))
+    finally:
+        # Cancelled or interrupted mid-request: close the steps so their breaker probe is
+        # released, after any step still running in its thread has returned
+        advance.add_done_callback(lambda _: steps.close())
+
+
+async def aclose() -> None:
+    """Closes the HTTP client owned by the running event loop (e.g. on app shutdown)."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def fetch_datetime(
+    format_str: str = "%Y-%m-%d %H:%M:%S",
+    unix_ts: int | None = None,
+    tz_offset_seconds: int | None = None
+) -> str:
+    # Pure computation, nothing to await.
+    return _sync.fetch_datetime(format_str, unix_ts, tz_offset_seconds)
+
+
+async def fetch_weather(
+    location: str,
+    country_code: str = "",
+    state_code: str = "",
+    limit: int = 1,
+    timeframe: str = "current",
+    time_offset: int = 0,
+    dt_unix: Optional[int] = None
+) -> str:
+    return await _run_http_steps(_sync._fetch_weather_steps(
+        location, country_code, state_code, limit, timeframe, time_offset, dt_unix
+    ))
+
+
+async def fetch_stock_price(
+    ticker_symbol: str,
+    period: str = "1d",
+    interval: str = "1d",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    compact: bool = True
+) -> str:
+    return await asyncio.to_thread(
+        _sync.fetch_stock_price, ticker_symbol, period, interval, start, end, compact
+    )
+
+
+async def fetch_stock_prices(
+    ticker_symbols: List[str],
+    period: str = "1d",
+    interval: str = "1d",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    compact: bool = True
+) -> str:
+    return await asyncio.to_thread(
+        _sync.fetch_stock_prices, ticker_symbols, period, interval, start, end, compact
+    )
+
+
+async def send_email(recipient: str, subject: str, body: str) -> str:
+    # The deployment's send_email is a mock without network I/O.
+    return _sync.send_email(recipient, subject, body)
+
+
+async def search_policies(query: str, top_k: int = 3) -> str:
+    # In-memory index lookup, nothing to await.
+    return _sync.search_policies(query, top_k)
+
+
+# Function tool definitions are generated from docstrings, so share them with the sync tools.
+for _fn in (fetch_datetime, fetch_weather, fetch_stock_price, fetch_stock_prices, send_email, search_policies):
+    _fn.__doc__ = getattr(_sync, _fn.__name__).__doc__
+
+# async registry matching enterprise_functions.enterprise_fns (for AsyncFunctionTool)
+enterprise_fns: Set[Callable[..., Awaitable[str]]] = {
+    fetch_datetime,
+    fetch_weather,
+    fetch_stock_price,
+    fetch_stock_prices,
+    send_email,
+    search_policies
+}
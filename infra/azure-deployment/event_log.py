@@ -0,0 +1,119 @@
+"""
+Non-blocking structured log sink for the streaming path.
+
+Callers only build a small dict and hand it to a bounded queue; a background thread
+formats the records as JSON lines and writes them to stdout, so a slow or contended
+stdout never holds up token delivery. When the queue is full records are dropped (and
+counted) instead of blocking. Per-token events are logged with delta(), which keeps only
+one in LOG_DELTA_SAMPLE_EVERY of them. Every accepted record, whatever its level, is also
+kept in a bounded in-memory ring buffer for debugging (see recent()).
+
+    LOG_LEVEL=info                 debug, info, warning or error
+    LOG_DELTA_SAMPLE_EVERY=50      keep 1 in N delta events (0 turns them off)
+    LOG_RING_SIZE=1000             records kept in memory
+    LOG_QUEUE_SIZE=10000           records waiting for the writer before new ones are dropped
+"""
+import atexit
+import itertools
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, TextIO
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info").lower()
+LOG_DELTA_SAMPLE_EVERY = int(os.getenv("LOG_DELTA_SAMPLE_EVERY", "50"))
+LOG_RING_SIZE = int(os.getenv("LOG_RING_SIZE", "1000"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+_STOP = object()
+
+
+class EventLog:
+    def __init__(
+        self,
+        level: str = LOG_LEVEL,
+        delta_sample_every: int = LOG_DELTA_SAMPLE_EVERY,
+        ring_size: int = LOG_RING_SIZE,
+        queue_size: int = LOG_QUEUE_SIZE,
+        stream: Optional[TextIO] = None,
+    ):
+        self.level = LEVELS.get(level, LEVELS["info"])
+        self.delta_sample_every = delta_sample_every
+        self.dropped = 0
+        self._stream = stream
+        self._ring: deque = deque(maxlen=ring_size)
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self._delta_counter = itertools.count()
+        self._writer = threading.Thread(target=self._write_loop, name="event-log-writer", daemon=True)
+        self._writer.start()
+
+    def log(self, level: str, event: str, **fields: Any) -> None:
+        record = {"ts": round(time.time(), 3), "level": level, "event": event, **fields}
+        self._ring.append(record)
+        if LEVELS.get(level, 0) < self.level:
+            return
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def debug(self, event: str, **fields: Any) -> None:
+        self.log("debug", event, **fields)
+
+    def info(self, event: str, **fields: Any) -> None:
+        self.log("info", event, **fields)
+
+    def warning(self, event: str, **fields: Any) -> None:
+        self.log("warning", event, **fields)
+
+    def error(self, event: str, **fields: Any) -> None:
+        self.log("error", event, **fields)
+
+    def delta(self, event: str, **fields: Any) -> None:
+        """Per-token events: only every `delta_sample_every`-th one is logged, at debug level."""
+        if self.delta_sample_every <= 0:
+            return
+        n = next(self._delta_counter)
+        if n % self.delta_sample_every == 0:
+            self.log("debug", event, sample_every=self.delta_sample_every, **fields)
+
+    def recent(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """The newest records from the ring buffer, oldest first."""
+        records = list(self._ring)
+        return records[-limit:] if limit else records
+
+    def _write_loop(self) -> None:
+        reported_drops = 0
+        while True:
+            record = self._queue.get()
+            if record is _STOP:
+                break
+            stream = self._stream or sys.stdout
+            try:
+                if self.dropped != reported_drops:
+                    stream.write(json.dumps({"ts": record["ts"], "level": "warning", "event": "log_dropped",
+                                             "count": self.dropped - reported_drops}) + "\n")
+                    reported_drops = self.dropped
+                stream.write(json.dumps(record, default=str) + "\n")
+                if self._queue.empty():
+                    stream.flush()
+            except Exception:
+                pass  # never let a broken stdout kill the writer
+
+    def close(self, timeout: float = 2.0) -> None:
+        """Writes out what is queued (up to `timeout`) and stops the writer."""
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._writer.join(timeout)
+
+
+event_log = EventLog()
+atexit.register(event_log.close)
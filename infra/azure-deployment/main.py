@@ -1,16 +1,23 @@
 import os
 import re
+import json
+import uuid
+import asyncio
+import concurrent.futures
 import signal
 import sys
 from datetime import datetime as pydatetime
-from typing import Any, List, Dict
+from typing import Any, AsyncIterator, List, Dict, Optional
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel
 import uvicorn
 import threading
 import time
+import weakref
 from azure.core.exceptions import ResourceExistsError
 from azure.core.pipeline.policies import RetryPolicy
 from azure.core.pipeline.transport import RequestsTransport
@@ -22,9 +29,14 @@ from gradio import ChatMessage
 
 # Azure AI Projects
 from azure.identity import DefaultAzureCredential
+from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
 from azure.ai.projects import AIProjectClient
+from azure.ai.projects.aio import AIProjectClient as AsyncAIProjectClient
 from azure.ai.projects.models import (
     AgentEventHandler,
+    AsyncAgentEventHandler,
+    AsyncFunctionTool,
+    AsyncToolSet,
     RunStep,
     RunStepDeltaChunk,
     ThreadMessage,
@@ -39,6 +51,18 @@ from azure.ai.projects.models import (
 
 # Your custom Python functions (for "fetch_weather","fetch_stock_price","send_email","fetch_datetime", etc.)
 from enterprise_functions import enterprise_fns
+import enterprise_functions
+import enterprise_functions_aio
+from policy_index import policy_context
+from tool_prefetch import Prefetcher
+from context_window import CONTEXT_SUMMARY, run_context_options, summarize_dropped_turns
+from tool_output_budget import budget_tool_output
+from single_flight import AsyncSingleFlight, SingleFlight, call_key
+from session_threads import SessionThreads, SessionLimitError
+from agent_bootstrap import bootstrap_agent, register_toolset
+from agent_metrics import StreamMetrics, active_stream, count_prefetch, count_rejection, observe_admission, observe_tool, render_metrics
+from admission import AdmissionController, AdmissionRejected
+from event_log import event_log
 
 load_dotenv(override=True)
 
@@ -55,70 +79,121 @@ project_client = AIProjectClient.from_connection_string(
 
 # Get the agent name from the environment variables
 AGENT_NAME = os.environ["AGENT_NAME"]
-
-# Find the agent by name
-found_agent = None
-all_agents_list = project_client.agents.list_agents().data
-for a in all_agents_list:
-    if a.name == AGENT_NAME:
-        found_agent = a
-        break
-
-if not found_agent:
-    raise ValueError(f"Agent with name '{AGENT_NAME}' not found.")
-
-agent_id = found_agent.id
-print(f"Using agent > {found_agent.name} (id: {agent_id})")
+VECTOR_STORE_NAME = os.environ["VECTOR_STORE_NAME"]
 
 # Print the value of BING_CONNECTION_NAME for debugging
 print(f"BING_CONNECTION_NAME: {os.environ['BING_CONNECTION_NAME']}")
 
-# Set Up Tools (BingGroundingTool, FileSearchTool)
-try:
-    bing_connection = project_client.connections.get(connection_name=os.environ["BING_CONNECTION_NAME"])
-    conn_id = bing_connection.id
-    bing_tool = BingGroundingTool(connection_id=conn_id)
-    print("bing > connected")
-except Exception as e:
-    bing_tool = None
-    print(f"bing failed > no connection found or permission issue: {e}")
-
-VECTOR_STORE_NAME = os.environ["VECTOR_STORE_NAME"]
-all_vector_stores = project_client.agents.list_vector_stores().data
-existing_vector_store = next(
-    (store for store in all_vector_stores if store.name == VECTOR_STORE_NAME),
-    None
-)
-
-vector_store_id = None
-if existing_vector_store:
-    vector_store_id = existing_vector_store.id
-    print(f"reusing vector store > {existing_vector_store.name} (id: {existing_vector_store.id})")
-
-file_search_tool = None
-if vector_store_id:
-    file_search_tool = FileSearchTool(vector_store_ids=[vector_store_id])
-    print("file search > connected")
-
 # Combine All Tools into a ToolSet
+def budget_tool_outputs(tool_calls, tool_outputs):
+    # Hold every function output to its size budget before it is submitted to the run
+    fn_names = {t.id: t.function.name for t in tool_calls if t.type == "function"}
+    for tool_output in tool_outputs:
+        fn_name = fn_names.get(tool_output["tool_call_id"], "")
+        output, clip = budget_tool_output(fn_name, str(tool_output["output"]))
+        if clip:
+            event_log.info("tool_output_clipped", function=fn_name, original_chars=clip["original_chars"],
+                           final_chars=clip["final_chars"], strategy=clip["strategy"])
+        tool_output["output"] = output
+    return tool_outputs
+
 class LoggingToolSet(ToolSet):
+    def __init__(self):
+        super().__init__()
+        self._flights = SingleFlight()
+
     def add(self, tool):
         super().add(tool)
         tool_name = getattr(tool, 'name', type(tool).__name__)
         print(f"tool > added {tool_name}")
 
-toolset = LoggingToolSet()
-if bing_tool:
-    toolset.add(bing_tool)
-if file_search_tool:
-    toolset.add(file_search_tool)
+    def _execute_function(self, tool_call):
+        # Identical concurrent calls (same function, same normalized arguments) share one execution
+        function_tool = self.get_tool(FunctionTool)
+        fn_name = tool_call.function.name
+        fn = function_tool._functions.get(fn_name)
+        # A prefetch of this lookup may still be downloading; let it fill the cache first
+        prefetched = claim_prefetches(fn_name, tool_call.function.arguments)
+        if prefetched:
+            concurrent.futures.wait(prefetched, timeout=TOOL_PREFETCH_WAIT_SECONDS)
+        key = call_key(fn, fn_name, tool_call.function.arguments) if fn else None
+        if key is None:
+            return function_tool.execute(tool_call)
+        output, shared = self._flights.do(key, lambda: function_tool.execute(tool_call))
+        if shared:
+            event_log.info("tool_call_shared", function=fn_name)
+        return output
+
+    def execute_tool_calls(self, tool_calls):
+        tool_outputs = []
+        for tool_call in tool_calls:
+            if tool_call.type != "function":
+                continue
+            started = time.perf_counter()
+            try:
+                output = self._execute_function(tool_call)
+            except Exception as e:
+                observe_tool(tool_call.function.name, time.perf_counter() - started, failed=True)
+                event_log.error("tool_failed", function=tool_call.function.name, error=str(e))
+            else:
+                observe_tool(tool_call.function.name, time.perf_counter() - started, output)
+                tool_outputs.append({"tool_call_id": tool_call.id, "output": output})
+        return budget_tool_outputs(tool_calls, tool_outputs)
 
-custom_functions = FunctionTool(enterprise_fns)
-toolset.add(custom_functions)
+class LoggingAsyncToolSet(AsyncToolSet):
+    """LoggingToolSet for the async client: tool functions from enterprise_functions_aio are awaited."""
 
-for tool in toolset._tools:
-    tool_name = getattr(tool, 'name', type(tool).__name__)
-    print(f"tool > {tool_name}")
+    def __init__(self):
+        super().__init__()
+        self._flights = AsyncSingleFlight()
+
+    async def _execute_function(self, tool_call):
+        function_tool = self.get_tool(AsyncFunctionTool)
+        fn_name = tool_call.function.name
+        fn = function_tool._functions.get(fn_name)
+        prefetched = claim_prefetches(fn_name, tool_call.function.arguments)
+        if prefetched:
+            await asyncio.wait([asyncio.wrap_future(f) for f in prefetched], timeout=TOOL_PREFETCH_WAIT_SECONDS)
+        key = call_key(fn, fn_name, tool_call.function.arguments) if fn else None
+        if key is None:
+            return await function_tool.execute(tool_call)
+        output, shared = await self._flights.do(key, lambda: function_tool.execute(tool_call))
+        if shared:
+            event_log.info("tool_call_shared", function=fn_name)
+        return output
+
+    async def execute_tool_calls(self, tool_calls):
+        tool_outputs = []
+        for tool_call in tool_calls:
+            if tool_call.type != "function":
+                continue
+            started = time.perf_counter()
+            try:
+                output = await self._execute_function(tool_call)
+            except Exception as e:
+                observe_tool(tool_call.function.name, time.perf_counter() - started, failed=True)
+                event_log.error("tool_failed", function=tool_call.function.name, error=str(e))
+            else:
+                observe_tool(tool_call.function.name, time.perf_counter() - started, output)
+                tool_outputs.append({"tool_call_id": tool_call.id, "output": output})
+        return budget_tool_outputs(tool_calls, tool_outputs)
+
+# Set Up Tools (BingGroundingTool, FileSearchTool) from the resolved connection/vector store ids
+def build_tools(resolved) -> list:
+    tools = []
+    if resolved["bing_connection_id"]:
+        tools.append(BingGroundingTool(connection_id=resolved["bing_connection_id"]))
+    if resolved["vector_store_id"]:
+        tools.append(FileSearchTool(vector_store_ids=[resolved["vector_store_id"]]))
+        print("file search > connected")
+    return tools
+
+def build_toolset(resolved) -> LoggingToolSet:
+    toolset = LoggingToolSet()
+    for tool in build_tools(resolved):
+        toolset.add(tool)
+    toolset.add(FunctionTool(enterprise_fns))
+    return toolset
 
 # Update the existing agent to use new tools
 def update_agent_with_retry(agent_id, model, instructions, toolset, retries=3, delay=5):
@@ -137,63 +212,180 @@ def update_agent_with_retry(agent_id, model, instructions, toolset, retries=3, d
             else:
                 raise
 
-agent = update_agent_with_retry(
-    agent_id=found_agent.id,
-    model=found_agent.model,
-    instructions=found_agent.instructions,
-    toolset=toolset,
+def update_agent(resolved, toolset):
+    agent = update_agent_with_retry(
+        agent_id=resolved["agent_id"],
+        model=resolved["model"],
+        instructions=resolved["instructions"],
+        toolset=toolset,
+    )
+    print(f"reusing agent > {agent.name} (id: {agent.id})")
+
+# Resolve the agent and update its tools once per instance; other workers reuse the result
+resolved_agent, toolset = bootstrap_agent(
+    project_client,
+    agent_name=AGENT_NAME,
+    bing_connection_name=os.environ["BING_CONNECTION_NAME"],
+    vector_store_name=VECTOR_STORE_NAME,
+    build_toolset=build_toolset,
+    update_agent=update_agent,
+)
+agent_id = resolved_agent["agent_id"]
+# Local function calls during streaming are executed by the client's registered toolset
+register_toolset(project_client.agents, agent_id, toolset)
+
+for tool in toolset._tools:
+    tool_name = getattr(tool, 'name', type(tool).__name__)
+    print(f"tool > {tool_name}")
+
+# Async Agents client for the async chat handler. It runs the same agent; its toolset has the
+# same definitions but awaits the async tool functions, so it is registered on the client
+# directly rather than through a second update_agent call.
+CHAT_ASYNC_HANDLER = os.getenv("CHAT_ASYNC_HANDLER", "true").lower() == "true"
+
+async_credential = AsyncDefaultAzureCredential()
+async_project_client = AsyncAIProjectClient.from_connection_string(
+    credential=async_credential,
+    conn_str=os.environ["PROJECT_CONNECTION_STRING"],
+)
+async_toolset = LoggingAsyncToolSet()
+for tool in build_tools(resolved_agent):
+    async_toolset.add(tool)
+async_toolset.add(AsyncFunctionTool(enterprise_functions_aio.enterprise_fns))
+register_toolset(async_project_client.agents, agent_id, async_toolset)
+
+# One conversation thread per browser session, created on first use
+SESSION_MAX_THREADS = int(os.getenv("SESSION_MAX_THREADS", "500"))
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "3600"))
+CHAT_CONCURRENCY_LIMIT = int(os.getenv("CHAT_CONCURRENCY_LIMIT", "16"))
+
+session_threads = SessionThreads(
+    create_thread=lambda: project_client.agents.create_thread().id,
+    delete_thread=lambda thread_id: project_client.agents.delete_thread(thread_id),
+    max_sessions=SESSION_MAX_THREADS,
+    idle_seconds=SESSION_IDLE_SECONDS,
+)
+
+# Admission control: at most ADMISSION_MAX_CONCURRENT responses stream per worker, up to
+# ADMISSION_MAX_QUEUE more wait for a slot, and the rest are told to come back later
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", str(CHAT_CONCURRENCY_LIMIT)))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "5"))
+
+def on_admission_rejected(reason: str) -> None:
+    count_rejection(reason)
+    event_log.warning("admission_rejected", reason=reason, active=admission.active, queued=admission.queued)
+
+admission = AdmissionController(
+    max_concurrent=ADMISSION_MAX_CONCURRENT,
+    max_queue=ADMISSION_MAX_QUEUE,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    retry_after=ADMISSION_RETRY_AFTER_SECONDS,
+    on_admitted=observe_admission,
+    on_rejected=on_admission_rejected,
 )
-print(f"reusing agent > {agent.name} (id: {agent.id})")
 
-# Create a Conversation Thread
-thread = project_client.agents.create_thread()
-print(f"thread > created (id: {thread.id})")
+# Speculative prefetch: weather/stock lookups named in the user's message start while the run
+# is queued, so the run's own call finds the tool caches warm
+TOOL_PREFETCH = os.getenv("TOOL_PREFETCH", "true").lower() in ("1", "true", "yes")
+TOOL_PREFETCH_WORKERS = int(os.getenv("TOOL_PREFETCH_WORKERS", "4"))
+TOOL_PREFETCH_CLAIM_SECONDS = float(os.getenv("TOOL_PREFETCH_CLAIM_SECONDS", "120"))
+TOOL_PREFETCH_WAIT_SECONDS = 30
+
+prefetcher = Prefetcher(
+    functions={
+        "fetch_weather": enterprise_functions.fetch_weather,
+        "fetch_stock_price": enterprise_functions.fetch_stock_price,
+        "fetch_stock_prices": enterprise_functions.fetch_stock_prices,
+    },
+    max_workers=TOOL_PREFETCH_WORKERS,
+    claim_seconds=TOOL_PREFETCH_CLAIM_SECONDS,
+    on_outcome=count_prefetch,
+) if TOOL_PREFETCH else None
+
+def start_prefetch(user_message: str) -> None:
+    if prefetcher is None:
+        return
+    for fn_name, arguments in prefetcher.prefetch(user_message):
+        event_log.info("tool_prefetch", function=fn_name, arguments=arguments)
+
+def claim_prefetches(fn_name: str, arguments: str) -> List[concurrent.futures.Future]:
+    return prefetcher.claim(fn_name, arguments) if prefetcher is not None else []
+
+ONE_OFF_SESSION_PREFIX = "anonymous-"
+
+def session_id_for(request: gr.Request) -> str:
+    # Calls without a browser session (e.g. the raw API) get a one-off id, i.e. a fresh thread
+    return getattr(request, "session_hash", None) or f"{ONE_OFF_SESSION_PREFIX}{time.time_ns()}"
+
+def is_one_off(session_id: str) -> bool:
+    # Nobody can come back to a one-off session, so its thread is deleted after the run
+    return session_id.startswith(ONE_OFF_SESSION_PREFIX)
+
+# Runs still streaming in this worker (via their event logs), so a shutdown can cancel them
+RUN_TERMINAL_STATUSES = ("completed", "failed", "cancelled", "expired")
+live_streams: "weakref.WeakSet[StreamEventLog]" = weakref.WeakSet()
+live_streams_lock = threading.Lock()
+
+def live_runs() -> List[tuple]:
+    """(thread_id, run_id) of every run that is still streaming."""
+    with live_streams_lock:
+        streams = list(live_streams)
+    return [s.active_run for s in streams if s.active_run is not None]
 
 # Define a Custom Event Handler
-class MyEventHandler(AgentEventHandler):
+class StreamEventLog:
+    """Structured logging for stream events, shared by the sync and async event handlers."""
+
     def __init__(self):
         super().__init__()
         self._current_message_id = None
-        self._accumulated_text = ""
+        self._accumulated_chars = 0
+        self.metrics = StreamMetrics()
+        self.active_run = None
+        with live_streams_lock:
+            live_streams.add(self)
 
     def on_message_delta(self, delta: MessageDeltaChunk) -> None:
+        self.metrics.on_token()
         # If a new message id, start fresh
         if delta.id != self._current_message_id:
-            # First, if we had an old message that wasn't completed, finish that line
-            if self._current_message_id is not None:
-                print()  # move to a new line
-            
             self._current_message_id = delta.id
-            self._accumulated_text = ""
-            print("\nassistant > ", end="")  # prefix for new message
+            self._accumulated_chars = 0
+            event_log.debug("assistant_message_started", message_id=delta.id)
 
-        # Accumulate partial text
-        partial_text = ""
+        # Count partial text; individual deltas are only sampled
+        partial_chars = 0
         if delta.delta.content:
             for chunk in delta.delta.content:
-                partial_text += chunk.text.get("value", "")
-        self._accumulated_text += partial_text
-
-        # Print partial text with no newline
-        print(partial_text, end="", flush=True)
+                partial_chars += len(chunk.text.get("value", ""))
+        self._accumulated_chars += partial_chars
+        event_log.delta("message_delta", message_id=delta.id, chars=partial_chars)
 
     def on_thread_message(self, message: ThreadMessage) -> None:
-        # When the assistant's entire message is "completed", print a final newline
+        # When the assistant's entire message is "completed", log it once
         if message.status == "completed" and message.role == "assistant":
-            print()  # done with this line
+            event_log.info(
+                "assistant_message",
+                message_id=message.id,
+                chars=self._accumulated_chars,
+                text=message.text_messages[0].text.value if message.text_messages else "",
+            )
             self._current_message_id = None
-            self._accumulated_text = ""
+            self._accumulated_chars = 0
         else:
-            # For other roles or statuses, you can log if you like:
-            print(f"{message.status.name.lower()} (id: {message.id})")
+            event_log.debug("message", message_id=message.id, status=message.status.name.lower())
 
     def on_thread_run(self, run: ThreadRun) -> None:
-        print(f"status > {run.status.name.lower()}")
+        self.metrics.on_run_status(run)
+        event_log.info("run_status", run_id=run.id, status=run.status.name.lower())
+        self.active_run = None if run.status in RUN_TERMINAL_STATUSES else (run.thread_id, run.id)
         if run.status == "failed":
-            print(f"error > {run.last_error}")
+            event_log.error("run_failed", run_id=run.id, last_error=run.last_error)
 
     def on_run_step(self, step: RunStep) -> None:
-        print(f"{step.type.name.lower()} > {step.status.name.lower()}")
+        event_log.debug("run_step", step_type=step.type.name.lower(), status=step.status.name.lower())
 
     def on_run_step_delta(self, delta: RunStepDeltaChunk) -> None:
         # If partial tool calls come in, we log them
@@ -201,16 +393,49 @@ class MyEventHandler(AgentEventHandler):
             for tcall in delta.delta.step_details.tool_calls:
                 if getattr(tcall, "function", None):
                     if tcall.function.name is not None:
-                        print(f"tool call > {tcall.function.name}")
+                        event_log.info("tool_call", function=tcall.function.name)
 
     def on_unhandled_event(self, event_type: str, event_data):
-        print(f"unhandled > {event_type} > {event_data}")
+        event_log.debug("unhandled_event", event_type=event_type, data=str(event_data))
 
     def on_error(self, data: str) -> None:
-        print(f"error > {data}")
+        self.metrics.on_error()
+        event_log.error("stream_error", data=data)
 
     def on_done(self) -> None:
-        print("done")
+        event_log.debug("stream_done")
+
+class MyEventHandler(StreamEventLog, AgentEventHandler):
+    pass
+
+class MyAsyncEventHandler(AsyncAgentEventHandler):
+    def __init__(self):
+        super().__init__()
+        self._log = StreamEventLog()
+
+    async def on_message_delta(self, delta: MessageDeltaChunk) -> None:
+        self._log.on_message_delta(delta)
+
+    async def on_thread_message(self, message: ThreadMessage) -> None:
+        self._log.on_thread_message(message)
+
+    async def on_thread_run(self, run: ThreadRun) -> None:
+        self._log.on_thread_run(run)
+
+    async def on_run_step(self, step: RunStep) -> None:
+        self._log.on_run_step(step)
+
+    async def on_run_step_delta(self, delta: RunStepDeltaChunk) -> None:
+        self._log.on_run_step_delta(delta)
+
+    async def on_unhandled_event(self, event_type: str, event_data):
+        self._log.on_unhandled_event(event_type, event_data)
+
+    async def on_error(self, data: str) -> None:
+        self._log.on_error(data)
+
+    async def on_done(self) -> None:
+        self._log.on_done()
 
 # Implement the Main Chat Functions
 def extract_bing_query(request_url: str) -> str:
@@ -225,101 +450,154 @@ def extract_bing_query(request_url: str) -> str:
     # If no match, fall back to entire request_url
     return request_url
 
-def convert_dict_to_chatmessage(msg: dict) -> ChatMessage:
+# Titles for tool bubbles
+function_titles = {
+    "fetch_weather": "☁️ fetching weather",
+    "fetch_datetime": "🕒 fetching datetime",
+    "fetch_stock_price": "📈 fetching financial info",
+    "fetch_stock_prices": "📈 fetching financial info",
+    "send_email": "✉️ sending mail",
+    "file_search": "📄 searching docs",
+    "search_policies": "📄 searching policies",
+    "bing_grounding": "🔍 searching bing",
+}
+
+# Policy questions get the best matching passages from the local index as run instructions,
+# which saves the file_search round trip when they already hold the answer
+POLICY_CONTEXT = os.getenv("POLICY_CONTEXT", "true").lower() in ("1", "true", "yes")
+
+def run_options_for(user_message: str, conversation: List[ChatMessage]) -> Dict[str, Any]:
     """
-    Convert a legacy dict-based message to a gr.ChatMessage.
-    Uses the 'metadata' sub-dict if present.
+    create_stream keyword arguments for a run: the bounded context window (see
+    context_window.py), plus additional instructions with a recap of the turns that left
+    the window and/or the policy passages for the question.
     """
-    return ChatMessage(
-        role=msg["role"],
-        content=msg["content"],
-        metadata=msg.get("metadata", None)
-    )
-
-def azure_enterprise_chat(user_message: str, history: List[dict]):
+    options = run_context_options()
+    instructions = []
+    if CONTEXT_SUMMARY:
+        recap = summarize_dropped_turns(conversation)
+        if recap:
+            instructions.append(recap)
+    if POLICY_CONTEXT:
+        context = policy_context(user_message)
+        if context:
+            event_log.info("policy_context", chars=len(context))
+            instructions.append(context)
+    if instructions:
+        options["additional_instructions"] = "\n\n".join(instructions)
+    return options
+
+def get_function_title(fn_name: str) -> str:
+    return function_titles.get(fn_name, f"🛠 calling {fn_name}")
+
+class ConversationStream:
     """
+    Translates agent stream events into chat bubbles on `conversation`, for both the sync and
+    the async chat handler.
+
     Accumulates partial function arguments into ChatMessage['content'], sets the
     corresponding tool bubble status from "pending" to "done" on completion,
     and also handles non-function calls like bing_grounding or file_search by appending a
     "pending" bubble. Then it moves them to "done" once tool calls complete.
 
-    This function returns a list of ChatMessage objects directly (no dict conversion).
-    Your Gradio Chatbot should be type="messages" to handle them properly.
+    Work per event is constant however long the conversation is: bubbles are found through
+    an id index, and streamed text/arguments are appended to per-bubble chunk buffers that
+    are only joined into ChatMessage.content when a frame is sent (see frame()).
     """
-    # Convert existing history from dict to ChatMessage
-    conversation = []
-    for msg_dict in history:
-        conversation.append(convert_dict_to_chatmessage(msg_dict))
-
-    # Append the user's new message
-    conversation.append(ChatMessage(role="user", content=user_message))
-
-    # Immediately yield two outputs to clear the textbox
-    yield conversation, ""
-
-    # Post user message to the thread (for your back-end logic)
-    project_client.agents.create_message(
-        thread_id=thread.id,
-        role="user",
-        content=user_message
-    )
-
-    # Mappings for partial function calls
-    call_id_for_index: Dict[int, str] = {}
-    partial_calls_by_index: Dict[int, dict] = {}
-    partial_calls_by_id: Dict[str, dict] = {}
-    in_progress_tools: Dict[str, ChatMessage] = {}
-
-    # Titles for tool bubbles
-    function_titles = {
-        "fetch_weather": "☁️ fetching weather",
-        "fetch_datetime": "🕒 fetching datetime",
-        "fetch_stock_price": "📈 fetching financial info",
-        "send_email": "✉️ sending mail",
-        "file_search": "📄 searching docs",
-        "bing_grounding": "🔍 searching bing",
-    }
-
-    def get_function_title(fn_name: str) -> str:
-        return function_titles.get(fn_name, f"🛠 calling {fn_name}")
 
+    def __init__(self, conversation: List[ChatMessage], record_events: bool = False):
+        self.conversation = conversation
+        self.done = False
+        # Incremental events (text deltas, tool status) for API clients; see drain_events()
+        self.events: Optional[List[dict]] = [] if record_events else None
+        # Per event: a bubble appeared or changed status, and how much text streamed in
+        self.status_changed = False
+        self.delta_chars = 0
+        # Mappings for partial function calls
+        self.call_id_for_index: Dict[int, str] = {}
+        self.partial_calls_by_index: Dict[int, dict] = {}
+        self.partial_calls_by_id: Dict[str, dict] = {}
+        self.in_progress_tools: Dict[str, ChatMessage] = {}
+        # Stream message id -> the assistant bubble its text goes into
+        self.messages_by_id: Dict[str, ChatMessage] = {}
+        # id(bubble) -> (bubble, content chunks, strip); and the bubbles changed since the last frame
+        self._buffers: Dict[int, tuple] = {}
+        self._dirty: Dict[int, tuple] = {}
+
+    def _emit(self, **event):
+        if self.events is not None:
+            self.events.append(event)
+
+    def drain_events(self) -> List[dict]:
+        """Returns and clears the events recorded since the last call."""
+        events = self.events or []
+        if self.events:
+            self.events = []
+        return events
+
+    def _track(self, msg_obj: ChatMessage, chunks: List[str], strip: bool = False):
+        self._buffers[id(msg_obj)] = (msg_obj, chunks, strip)
+
+    def _append_text(self, msg_obj: ChatMessage, text: str):
+        buffer = self._buffers.get(id(msg_obj))
+        if buffer is None:
+            buffer = (msg_obj, [msg_obj.content or ""], False)
+            self._buffers[id(msg_obj)] = buffer
+        buffer[1].append(text)
+        self._dirty[id(msg_obj)] = buffer
+
+    def frame(self) -> List[ChatMessage]:
+        """Joins the chunk buffers of bubbles changed since the last frame and returns the conversation."""
+        for msg_obj, chunks, strip in self._dirty.values():
+            content = "".join(chunks)
+            chunks[:] = [content]
+            msg_obj.content = content.strip() if strip else content
+        self._dirty.clear()
+        return self.conversation
+
+    @staticmethod
     def accumulate_args(storage: dict, name_chunk: str, arg_chunk: str):
         """Accumulates partial JSON data for a function call."""
         if name_chunk:
             storage["name"] += name_chunk
         if arg_chunk:
-            storage["args"] += arg_chunk
+            storage["args"].append(arg_chunk)
 
-    def finalize_tool_call(call_id: str):
+    def finalize_tool_call(self, call_id: str, name_changed: bool, arg_chunk: str = ""):
         """Creates or updates the ChatMessage bubble for a function call."""
-        if call_id not in partial_calls_by_id:
+        if call_id not in self.partial_calls_by_id:
             return
-        data = partial_calls_by_id[call_id]
+        data = self.partial_calls_by_id[call_id]
         fn_name = data["name"].strip()
-        fn_args = data["args"].strip()
         if not fn_name:
             return
 
-        if call_id not in in_progress_tools:
+        if call_id not in self.in_progress_tools:
             # Create a new bubble with status="pending"
             msg_obj = ChatMessage(
                 role="assistant",
-                content=fn_args or "",
+                content="".join(data["args"]).strip(),
                 metadata={
                     "title": get_function_title(fn_name),
                     "status": "pending",
                     "id": f"tool-{call_id}"
                 }
             )
-            conversation.append(msg_obj)
-            in_progress_tools[call_id] = msg_obj
+            self.conversation.append(msg_obj)
+            self.in_progress_tools[call_id] = msg_obj
+            self._track(msg_obj, data["args"], strip=True)
+            self.status_changed = True
+            self._emit(type="tool", id=call_id, name=fn_name, status="pending", arguments=msg_obj.content)
         else:
             # Update existing bubble
-            msg_obj = in_progress_tools[call_id]
-            msg_obj.content = fn_args or ""
-            msg_obj.metadata["title"] = get_function_title(fn_name)
-
-    def upsert_tool_call(tcall: dict):
+            msg_obj = self.in_progress_tools[call_id]
+            self._dirty[id(msg_obj)] = self._buffers[id(msg_obj)]
+            if name_changed:
+                msg_obj.metadata["title"] = get_function_title(fn_name)
+            if arg_chunk:
+                self._emit(type="tool_arguments", id=call_id, delta=arg_chunk)
+
+    def upsert_tool_call(self, tcall: dict):
         """
         1) Check the call type
         2) If "function", gather partial name/args
@@ -347,9 +625,11 @@ def azure_enterprise_chat(user_message: str, history: List[dict]):
                     "id": f"tool-{call_id}" if call_id else "tool-noid"
                 }
             )
-            conversation.append(msg_obj)
+            self.conversation.append(msg_obj)
             if call_id:
-                in_progress_tools[call_id] = msg_obj
+                self.in_progress_tools[call_id] = msg_obj
+            self.status_changed = True
+            self._emit(type="tool", id=call_id, name="bing_grounding", status="pending", arguments=query_str)
             return
 
         # --- FILE SEARCH ---
@@ -363,9 +643,11 @@ def azure_enterprise_chat(user_message: str, history: List[dict]):
                     "id": f"tool-{call_id}" if call_id else "tool-noid"
                 }
             )
-            conversation.append(msg_obj)
+            self.conversation.append(msg_obj)
             if call_id:
-                in_progress_tools[call_id] = msg_obj
+                self.in_progress_tools[call_id] = msg_obj
+            self.status_changed = True
+            self._emit(type="tool", id=call_id, name="file_search", status="pending")
             return
 
         # --- NON-FUNCTION CALLS ---
@@ -380,137 +662,344 @@ def azure_enterprise_chat(user_message: str, history: List[dict]):
         arg_chunk = fn_data.get("arguments", "")
 
         if new_call_id:
-            call_id_for_index[index] = new_call_id
+            self.call_id_for_index[index] = new_call_id
 
-        call_id = call_id_for_index.get(index)
+        call_id = self.call_id_for_index.get(index)
         if not call_id:
             # Accumulate partial
-            if index not in partial_calls_by_index:
-                partial_calls_by_index[index] = {"name": "", "args": ""}
-            accumulate_args(partial_calls_by_index[index], name_chunk, arg_chunk)
+            if index not in self.partial_calls_by_index:
+                self.partial_calls_by_index[index] = {"name": "", "args": []}
+            self.accumulate_args(self.partial_calls_by_index[index], name_chunk, arg_chunk)
             return
 
-        if call_id not in partial_calls_by_id:
-            partial_calls_by_id[call_id] = {"name": "", "args": ""}
+        if call_id not in self.partial_calls_by_id:
+            self.partial_calls_by_id[call_id] = {"name": "", "args": []}
 
-        if index in partial_calls_by_index:
-            old_data = partial_calls_by_index.pop(index)
-            partial_calls_by_id[call_id]["name"] += old_data.get("name", "")
-            partial_calls_by_id[call_id]["args"] += old_data.get("args", "")
+        name_changed = bool(name_chunk)
+        if index in self.partial_calls_by_index:
+            old_data = self.partial_calls_by_index.pop(index)
+            self.partial_calls_by_id[call_id]["name"] += old_data["name"]
+            self.partial_calls_by_id[call_id]["args"].extend(old_data["args"])
+            name_changed = name_changed or bool(old_data["name"])
 
         # Accumulate partial
-        accumulate_args(partial_calls_by_id[call_id], name_chunk, arg_chunk)
+        self.accumulate_args(self.partial_calls_by_id[call_id], name_chunk, arg_chunk)
+        self.delta_chars += len(arg_chunk or "")
 
         # Create/update the function bubble
-        finalize_tool_call(call_id)
-
-    # -- EVENT STREAMING --
-    with project_client.agents.create_stream(
-        thread_id=thread.id,
-        assistant_id=agent_id,
-        event_handler=MyEventHandler()  # the event handler handles console output
-    ) as stream:
-        for item in stream:
-            event_type, event_data, *_ = item
-
-            # Remove any None items that might have been appended
-            conversation = [m for m in conversation if m is not None]
-
-            # 1) Partial tool calls
-            if event_type == "thread.run.step.delta":
-                step_delta = event_data.get("delta", {}).get("step_details", {})
-                if step_delta.get("type") == "tool_calls":
-                    for tcall in step_delta.get("tool_calls", []):
-                        upsert_tool_call(tcall)
-                    yield conversation, ""
-
-            # 2) run_step
-            elif event_type == "run_step":
-                step_type = event_data["type"]
-                step_status = event_data["status"]
-
-                # If tool calls are in progress, new or partial
-                if step_type == "tool_calls" and step_status == "in_progress":
-                    for tcall in event_data["step_details"].get("tool_calls", []):
-                        upsert_tool_call(tcall)
-                    yield conversation, ""
-
-                elif step_type == "tool_calls" and step_status == "completed":
-                    for cid, msg_obj in in_progress_tools.items():
-                        msg_obj.metadata["status"] = "done"
-                    in_progress_tools.clear()
-                    partial_calls_by_id.clear()
-                    partial_calls_by_index.clear()
-                    call_id_for_index.clear()
-                    yield conversation, ""
-
-                elif step_type == "message_creation" and step_status == "in_progress":
-                    msg_id = event_data["step_details"]["message_creation"].get("message_id")
-                    if msg_id:
-                        conversation.append(ChatMessage(role="assistant", content=""))
-                    yield conversation, ""
-
-                elif step_type == "message_creation" and step_status == "completed":
-                    yield conversation, ""
-
-            # 3) partial text from the assistant
-            elif event_type == "thread.message.delta":
-                agent_msg = ""
-                for chunk in event_data["delta"]["content"]:
-                    agent_msg += chunk["text"].get("value", "")
-
-                message_id = event_data["id"]
-
-                # Try to find a matching assistant bubble
-                matching_msg = None
-                for msg in reversed(conversation):
-                    if msg.metadata and msg.metadata.get("id") == message_id and msg.role == "assistant":
-                        matching_msg = msg
-                        break
-
-                if matching_msg:
-                    # Append newly streamed text
-                    matching_msg.content += agent_msg
+        self.finalize_tool_call(call_id, name_changed, arg_chunk)
+
+    def complete_tools(self):
+        """Marks every pending tool bubble as done."""
+        for cid, msg_obj in self.in_progress_tools.items():
+            msg_obj.metadata["status"] = "done"
+            self.status_changed = True
+            self._emit(type="tool", id=cid, status="done")
+        self.in_progress_tools.clear()
+        self.partial_calls_by_id.clear()
+        self.partial_calls_by_index.clear()
+        self.call_id_for_index.clear()
+
+    def handle(self, event_type: str, event_data) -> bool:
+        """Applies one stream event; returns True if the conversation should be re-rendered."""
+        self.status_changed = False
+        self.delta_chars = 0
+        conversation = self.conversation
+
+        # 1) Partial tool calls
+        if event_type == "thread.run.step.delta":
+            step_delta = event_data.get("delta", {}).get("step_details", {})
+            if step_delta.get("type") == "tool_calls":
+                for tcall in step_delta.get("tool_calls", []):
+                    self.upsert_tool_call(tcall)
+                return True
+
+        # 2) run_step
+        elif event_type == "run_step":
+            step_type = event_data["type"]
+            step_status = event_data["status"]
+
+            # If tool calls are in progress, new or partial
+            if step_type == "tool_calls" and step_status == "in_progress":
+                for tcall in event_data["step_details"].get("tool_calls", []):
+                    self.upsert_tool_call(tcall)
+                return True
+
+            elif step_type == "tool_calls" and step_status == "completed":
+                self.complete_tools()
+                return True
+
+            elif step_type == "message_creation" and step_status == "in_progress":
+                msg_id = event_data["step_details"]["message_creation"].get("message_id")
+                if msg_id:
+                    msg_obj = ChatMessage(role="assistant", content="")
+                    conversation.append(msg_obj)
+                    self.messages_by_id[msg_id] = msg_obj
+                    self.status_changed = True
+                return True
+
+            elif step_type == "message_creation" and step_status == "completed":
+                return True
+
+        # 3) partial text from the assistant
+        elif event_type == "thread.message.delta":
+            agent_msg = ""
+            for chunk in event_data["delta"]["content"]:
+                agent_msg += chunk["text"].get("value", "")
+            self.delta_chars = len(agent_msg)
+
+            message_id = event_data["id"]
+
+            # Find the bubble this message streams into
+            matching_msg = self.messages_by_id.get(message_id)
+
+            if matching_msg is None:
+                # Append to last assistant or create new
+                if (
+                    not conversation
+                    or conversation[-1].role != "assistant"
+                    or (
+                        conversation[-1].metadata
+                        and str(conversation[-1].metadata.get("id", "")).startswith("tool-")
+                    )
+                ):
+                    matching_msg = ChatMessage(role="assistant", content="")
+                    conversation.append(matching_msg)
+                    self.status_changed = True
                 else:
-                    # Append to last assistant or create new
-                    if (
-                        not conversation
-                        or conversation[-1].role != "assistant"
-                        or (
-                            conversation[-1].metadata
-                            and str(conversation[-1].metadata.get("id", "")).startswith("tool-")
-                        )
-                    ):
-                        conversation.append(ChatMessage(role="assistant", content=agent_msg))
-                    else:
-                        conversation[-1].content += agent_msg
-
-                yield conversation, ""
+                    matching_msg = conversation[-1]
+                self.messages_by_id[message_id] = matching_msg
+
+            # Append newly streamed text
+            self._append_text(matching_msg, agent_msg)
+            if agent_msg:
+                self._emit(type="text", message_id=message_id, delta=agent_msg)
+            return True
+
+        # 4) If entire assistant message is completed
+        elif event_type == "thread.message":
+            if event_data["role"] == "assistant" and event_data["status"] == "completed":
+                self.complete_tools()
+                return True
+
+        # 5) Final done
+        elif event_type == "thread.message.completed":
+            self.complete_tools()
+            self.done = True
+            self._emit(type="done")
+            return True
+
+        return False
+
+# Streaming deltas are batched into UI frames: a frame goes out once CHAT_FRAME_INTERVAL_MS has
+# passed or CHAT_FRAME_MAX_CHARS of text has arrived, and immediately when a bubble appears,
+# a tool changes status or the response completes.
+CHAT_FRAME_INTERVAL_SECONDS = float(os.getenv("CHAT_FRAME_INTERVAL_MS", "200")) / 1000
+CHAT_FRAME_MAX_CHARS = int(os.getenv("CHAT_FRAME_MAX_CHARS", "400"))
+
+class FrameCoalescer:
+    def __init__(self, interval_seconds: float = CHAT_FRAME_INTERVAL_SECONDS, max_chars: int = CHAT_FRAME_MAX_CHARS):
+        self.interval_seconds = interval_seconds
+        self.max_chars = max_chars
+        self.events = 0
+        self.frames = 0
+        self.pending = False
+        self._pending_chars = 0
+        self._last_frame = 0.0
+
+    def ready(self, chars: int = 0, flush: bool = False) -> bool:
+        """Records one change; returns True when a frame should be sent now."""
+        self.events += 1
+        self._pending_chars += chars
+        now = time.monotonic()
+        if not (
+            flush
+            or self._pending_chars >= self.max_chars
+            or now - self._last_frame >= self.interval_seconds
+        ):
+            self.pending = True
+            return False
+        self.frames += 1
+        self.pending = False
+        self._pending_chars = 0
+        self._last_frame = now
+        return True
+
+    def should_send(self, translator: ConversationStream) -> bool:
+        return self.ready(translator.delta_chars, flush=translator.status_changed or translator.done)
+
+SESSION_BUSY_MESSAGE = "The assistant is busy with too many conversations, please try again shortly."
+ADMISSION_BUSY_MESSAGE = "The assistant is at capacity right now, please try again in a few seconds."
+SERVER_RESTARTING_MESSAGE = "The assistant is restarting, please try again in a few seconds."
+
+def admission_message(e: AdmissionRejected) -> str:
+    return SERVER_RESTARTING_MESSAGE if e.reason == "draining" else ADMISSION_BUSY_MESSAGE
+
+def azure_enterprise_chat(user_message: str, request: gr.Request):
+    """
+    Streams the agent's response to `user_message` as a list of ChatMessage objects (see
+    ConversationStream). Blocking version: holds a worker thread for the whole stream.
 
-            # 4) If entire assistant message is completed
-            elif event_type == "thread.message":
-                if event_data["role"] == "assistant" and event_data["status"] == "completed":
-                    for cid, msg_obj in in_progress_tools.items():
-                        msg_obj.metadata["status"] = "done"
-                    in_progress_tools.clear()
-                    partial_calls_by_id.clear()
-                    partial_calls_by_index.clear()
-                    call_id_for_index.clear()
-                    yield conversation, ""
+    The browser only sends the new message; the conversation shown is the session's
+    transcript held on the server (see SessionThreads.transcript), which the response is
+    appended to. Your Gradio Chatbot should be type="messages" to handle it properly.
+    """
+    session_id = session_id_for(request)
+    user_bubble = ChatMessage(role="user", content=user_message)
+
+    # Immediately show the message and clear the textbox
+    yield session_threads.transcript(session_id) + [user_bubble], ""
+
+    # Runs on this browser session's own thread; a second submit waits for the first run
+    try:
+        with admission.slot(), session_threads.use(session_id, is_one_off(session_id)) as thread_id, active_stream():
+            conversation = session_threads.transcript(session_id)
+            conversation.append(user_bubble)
+            start_prefetch(user_message)
+
+            # Post user message to the thread (for your back-end logic)
+            project_client.agents.create_message(
+                thread_id=thread_id,
+                role="user",
+                content=user_message
+            )
 
-            # 5) Final done
-            elif event_type == "thread.message.completed":
-                for cid, msg_obj in in_progress_tools.items():
-                    msg_obj.metadata["status"] = "done"
-                in_progress_tools.clear()
-                partial_calls_by_id.clear()
-                partial_calls_by_index.clear()
-                call_id_for_index.clear()
+            # -- EVENT STREAMING --
+            translator = ConversationStream(conversation)
+            frames = FrameCoalescer()
+            try:
+                with project_client.agents.create_stream(
+                    thread_id=thread_id,
+                    assistant_id=agent_id,
+                    event_handler=MyEventHandler(),  # the event handler handles console output
+                    **run_options_for(user_message, conversation)
+                ) as stream:
+                    for item in stream:
+                        # The response is final once its message completes, but the stream is
+                        # read to the run's terminal status for the event handler's metrics
+                        if translator.done:
+                            continue
+                        event_type, event_data, *_ = item
+                        if translator.handle(event_type, event_data) and frames.should_send(translator):
+                            yield translator.frame(), ""
+            finally:
+                # Leave the stored transcript with all streamed text joined in
+                translator.frame()
+            # Send whatever is still batched if the stream ended without a completion event
+            if frames.pending:
                 yield conversation, ""
-                break
+            event_log.info("frames", updates=frames.events, frames=frames.frames)
+    except AdmissionRejected as e:
+        raise gr.Error(admission_message(e))
+    except SessionLimitError:
+        raise gr.Error(SESSION_BUSY_MESSAGE)
 
     return conversation, ""
 
+async def stream_agent_response_async(thread_id: str, user_message: str, translator: ConversationStream) -> AsyncIterator[None]:
+    """
+    Posts the user's message and streams the agent's run on the async client, feeding every
+    event to `translator` and yielding whenever it changed. Shared by the async Gradio handler
+    and the streaming chat API.
+    """
+    start_prefetch(user_message)
+    await async_project_client.agents.create_message(
+        thread_id=thread_id,
+        role="user",
+        content=user_message
+    )
+    async with await async_project_client.agents.create_stream(
+        thread_id=thread_id,
+        assistant_id=agent_id,
+        event_handler=MyAsyncEventHandler(),
+        **run_options_for(user_message, translator.conversation)
+    ) as stream:
+        async for item in stream:
+            # The response is final once its message completes, but the stream is read to
+            # the run's terminal status for the event handler's metrics
+            if translator.done:
+                continue
+            event_type, event_data, *_ = item
+            if translator.handle(event_type, event_data):
+                yield
+
+async def azure_enterprise_chat_async(user_message: str, request: gr.Request):
+    """
+    Same contract as azure_enterprise_chat, on the async Agents client: the stream and the
+    tool calls are awaited on the event loop, so an open stream holds a socket, not a thread.
+    """
+    session_id = session_id_for(request)
+    user_bubble = ChatMessage(role="user", content=user_message)
+
+    # Immediately show the message and clear the textbox
+    yield session_threads.transcript(session_id) + [user_bubble], ""
+
+    try:
+        async with admission.slot_async(), session_threads.use_async(session_id, is_one_off(session_id)) as thread_id:
+            with active_stream():
+                conversation = session_threads.transcript(session_id)
+                conversation.append(user_bubble)
+                translator = ConversationStream(conversation)
+                frames = FrameCoalescer()
+                try:
+                    async for _ in stream_agent_response_async(thread_id, user_message, translator):
+                        if frames.should_send(translator):
+                            yield translator.frame(), ""
+                finally:
+                    # Leave the stored transcript with all streamed text joined in
+                    translator.frame()
+                # Send whatever is still batched if the stream ended without a completion event
+                if frames.pending:
+                    yield conversation, ""
+                event_log.info("frames", updates=frames.events, frames=frames.frames)
+    except AdmissionRejected as e:
+        raise gr.Error(admission_message(e))
+    except SessionLimitError:
+        raise gr.Error(SESSION_BUSY_MESSAGE)
+
+# Streaming chat API for programmatic clients (bots, portals): only incremental events go over
+# the wire, as server-sent events or NDJSON lines. Event types: "session", "text"
+# (message_id, delta), "tool" (id, name, status, arguments), "tool_arguments" (id, delta),
+# "done" and "error".
+class ChatRequest(BaseModel):
+    message: str
+    session_id: Optional[str] = None
+
+def encode_event(event: dict, stream_format: str) -> str:
+    if stream_format == "ndjson":
+        return json.dumps(event) + "\n"
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+async def stream_chat_events(chat: ChatRequest, stream_format: str, ticket) -> AsyncIterator[str]:
+    """
+    Streams one response in an admission slot (`ticket`) taken before the response started.
+    API sessions are kept for their session_id to be sent back, and expire like UI sessions
+    (SESSION_IDLE_SECONDS, SESSION_MAX_THREADS). Like the UI, each keeps a server-side
+    transcript, which the CONTEXT_SUMMARY recap of older turns is built from.
+    """
+    session_id = chat.session_id or uuid.uuid4().hex
+    yield encode_event({"type": "session", "session_id": session_id}, stream_format)
+    try:
+        async with session_threads.use_async(f"api-{session_id}") as thread_id:
+            with active_stream():
+                conversation = session_threads.transcript(f"api-{session_id}")
+                conversation.append(ChatMessage(role="user", content=chat.message))
+                translator = ConversationStream(conversation, record_events=True)
+                try:
+                    async for _ in stream_agent_response_async(thread_id, chat.message, translator):
+                        for event in translator.drain_events():
+                            yield encode_event(event, stream_format)
+                finally:
+                    # Join the streamed text into the transcript for later recaps
+                    translator.frame()
+    except SessionLimitError:
+        yield encode_event({"type": "error", "message": SESSION_BUSY_MESSAGE}, stream_format)
+    except Exception as e:
+        event_log.error("chat_api_failed", error=str(e))
+        yield encode_event({"type": "error", "message": "The agent run failed."}, stream_format)
+    finally:
+        ticket.release()
+
 # Initialize FastAPI app
 import sys
 import threading
@@ -524,6 +1013,34 @@ import uvicorn
 # Initialize FastAPI app
 app = FastAPI()
 
+# Prometheus scrape endpoint (registered before the Gradio mount at "/")
+@app.get("/metrics")
+def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.post("/api/chat")
+async def chat_api(chat: ChatRequest, format: str = "sse"):
+    """Streams one agent response. Pass the returned session_id back to continue the conversation."""
+    stream_format = "ndjson" if format == "ndjson" else "sse"
+    media_type = "application/x-ndjson" if stream_format == "ndjson" else "text/event-stream"
+    # Admit before streaming starts so a busy worker can still answer with a proper status code
+    try:
+        ticket = await admission.acquire_async()
+    except AdmissionRejected as e:
+        return JSONResponse(
+            {"error": admission_message(e), "reason": e.reason},
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    return StreamingResponse(
+        stream_chat_events(chat, stream_format, ticket),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also frees the slot if the client disconnects before the stream got going
+        background=BackgroundTask(ticket.release),
+    )
+
 # Allow CORS for all origins
 app.add_middleware(
     CORSMiddleware,
@@ -564,9 +1081,8 @@ brand_theme = gr.themes.Default(
 
 with gr.Blocks(theme=brand_theme, css="footer {visibility: hidden;}", fill_height=True) as demo:
 
-    def clear_thread():
-        global thread
-        thread = project_client.agents.create_thread()
+    def clear_thread(request: gr.Request):
+        session_threads.reset(session_id_for(request))
         return []
 
     def on_example_clicked(evt: gr.SelectData):
@@ -598,9 +1114,12 @@ with gr.Blocks(theme=brand_theme, css="footer {visibility: hidden;}", fill_heigh
     # On submit: call azure_enterprise_chat, then clear the textbox
     (textbox
      .submit(
-         fn=azure_enterprise_chat,
-         inputs=[textbox, chatbot],
+         fn=azure_enterprise_chat_async if CHAT_ASYNC_HANDLER else azure_enterprise_chat,
+         # Only the new message goes up; the transcript lives with the session on the server
+         inputs=[textbox],
          outputs=[chatbot, textbox],
+         # Let queued submits reach the admission controller, which bounds the wait
+         concurrency_limit=ADMISSION_MAX_CONCURRENT + ADMISSION_MAX_QUEUE,
      )
      .then(
          fn=lambda: "",
@@ -611,12 +1130,65 @@ with gr.Blocks(theme=brand_theme, css="footer {visibility: hidden;}", fill_heigh
     # A "Clear" button that resets the thread and the Chatbot
     chatbot.clear(fn=clear_thread, outputs=chatbot)
 
+@app.on_event("shutdown")
+async def close_async_clients():
+    if prefetcher is not None:
+        prefetcher.shutdown()
+    await async_project_client.close()
+    await async_credential.close()
+    await enterprise_functions_aio.aclose()
+
 # ✅ Correctly mount Gradio inside FastAPI
 app = gr.mount_gradio_app(app, demo, path="/")
 
-# ✅ Signal handler for graceful shutdown (without sys.exit)
-def signal_handler(sig, frame):
-    print("Shutting down gracefully...")
-    raise SystemExit(0)
+# Graceful drain on SIGTERM/SIGINT: stop admitting chats, give the streams in flight up to
+# DRAIN_TIMEOUT_SECONDS to finish, cancel the service runs of those that don't, then hand the
+# signal to the server's own handler (uvicorn/gunicorn) to exit. A second signal exits at once.
+DRAIN_TIMEOUT_SECONDS = float(os.getenv("DRAIN_TIMEOUT_SECONDS", "25"))
+DRAIN_CANCEL_WAIT_SECONDS = 5
+drain_tasks: set = set()  # keeps the drain task referenced while it runs
+
+async def drain_and_exit(sig: int, previous_handler) -> None:
+    admission.start_draining()
+    event_log.warning("drain_started", signal=signal.Signals(sig).name, active=admission.active)
+    drained = await admission.wait_idle(DRAIN_TIMEOUT_SECONDS)
+    if not drained:
+        runs = live_runs()
+        event_log.warning("drain_timeout", active=admission.active, runs=len(runs))
+        for thread_id, run_id in runs:
+            try:
+                await async_project_client.agents.cancel_run(thread_id=thread_id, run_id=run_id)
+                event_log.info("run_cancelled", run_id=run_id)
+            except Exception as e:
+                event_log.error("run_cancel_failed", run_id=run_id, error=str(e))
+        # Cancelled runs end their streams, which then release their slots
+        drained = await admission.wait_idle(DRAIN_CANCEL_WAIT_SECONDS)
+    event_log.warning("drain_finished", drained=drained, active=admission.active)
+    if callable(previous_handler):
+        previous_handler(sig, None)
+    else:
+        raise SystemExit(0)
+
+@app.on_event("startup")
+async def install_drain_handlers():
+    # Runs after the server installed its own handlers, which are chained to when the drain ends
+    if threading.current_thread() is not threading.main_thread():
+        return
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previous_handler = signal.getsignal(sig)
+
+        def handle_signal(signum, frame, previous_handler=previous_handler):
+            if admission.draining:
+                if callable(previous_handler):
+                    previous_handler(signum, frame)
+                else:
+                    raise SystemExit(0)
+                return
+            # Only the flag here: the handler may interrupt code holding the admission lock
+            admission.draining = True
+            loop.call_soon_threadsafe(
+                lambda: drain_tasks.add(loop.create_task(drain_and_exit(signum, previous_handler)))
+            )
 
-signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(sig, handle_signal)
@@ -0,0 +1,189 @@
+"""
+In-process BM25 index over the policy documents in enterprise-data/.
+
+Policy questions ("How many vacation days...", "remote work policy") otherwise need a
+file_search round trip against the remote vector store inside the run. The corpus is a
+handful of small markdown files, so each "## " section becomes a passage in a local
+inverted index that answers in well under a millisecond. The index is rebuilt when the
+content hash of the folder changes (checked at most every POLICY_INDEX_CHECK_SECONDS).
+
+    POLICY_INDEX_DIR=enterprise-data        folder of .md files (relative to this module)
+    POLICY_INDEX_CHECK_SECONDS=10           how often to look for changed files
+    POLICY_CONTEXT_MIN_SCORE=4.0            minimum BM25 score for pre-retrieved context
+    POLICY_CONTEXT_MIN_COVERAGE=0.5         ...and minimum share of the query terms it matches
+
+The timing script (`python policy_index.py`) lives in the repository root's copy, next to
+the test questions in test_data/.
+"""
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+POLICY_INDEX_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.getenv("POLICY_INDEX_DIR", "enterprise-data")
+)
+POLICY_INDEX_CHECK_SECONDS = float(os.getenv("POLICY_INDEX_CHECK_SECONDS", "10"))
+POLICY_CONTEXT_MIN_SCORE = float(os.getenv("POLICY_CONTEXT_MIN_SCORE", "4.0"))
+POLICY_CONTEXT_MIN_COVERAGE = float(os.getenv("POLICY_CONTEXT_MIN_COVERAGE", "0.5"))
+
+_STOPWORDS = {
+    "a", "about", "all", "an", "and", "any", "are", "as", "at", "based", "be", "by", "can", "do",
+    "does", "for", "from", "get", "have", "how", "i", "in", "is", "it", "its", "like", "many",
+    "me", "much", "my", "new", "next", "now", "of", "on", "or", "our", "over", "per", "s",
+    "should", "that", "the", "their", "there", "this", "to", "today", "up", "we", "what",
+    "whats", "when", "which", "who", "will", "with", "you", "your",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", text.lower().replace("'", "")):
+        if token in _STOPWORDS:
+            continue
+        # Light stemming so "policies"/"policy" and "days"/"day" meet
+        if len(token) > 4 and token.endswith("ies"):
+            token = token[:-3] + "y"
+        elif len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def split_passages(source: str, markdown: str) -> List[Dict[str, str]]:
+    """One passage per "## " section, prefixed with the document title for context."""
+    title = source
+    passages = []
+    section, lines = None, []
+
+    def flush():
+        text = "\n".join(lines).strip()
+        if text:
+            passages.append({"source": source, "title": title, "section": section or title, "text": text})
+
+    for line in markdown.splitlines():
+        if line.startswith("# "):
+            title = line[2:].strip()
+        elif line.startswith("## "):
+            flush()
+            section, lines = line[3:].strip(), []
+        else:
+            lines.append(line)
+    flush()
+    return passages
+
+
+class PolicyIndex:
+    def __init__(self, folder: str = POLICY_INDEX_DIR, check_seconds: float = POLICY_INDEX_CHECK_SECONDS,
+                 k1: float = 1.5, b: float = 0.75):
+        self.folder = folder
+        self.check_seconds = check_seconds
+        self.k1 = k1
+        self.b = b
+        self.fingerprint: Optional[str] = None
+        self.builds = 0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        # Replaced as a whole on rebuild, so readers never see a half-built index
+        self._index: Tuple[List[Dict[str, str]], Dict[str, List[Tuple[int, int]]], List[int], float] = ([], {}, [], 0.0)
+
+    def _read_corpus(self) -> Tuple[str, Dict[str, str]]:
+        files = {}
+        if os.path.isdir(self.folder):
+            for name in sorted(os.listdir(self.folder)):
+                if name.endswith(".md"):
+                    with open(os.path.join(self.folder, name), encoding="utf-8") as f:
+                        files[name] = f.read()
+        digest = hashlib.sha256()
+        for name, content in files.items():
+            digest.update(name.encode())
+            digest.update(hashlib.sha256(content.encode()).digest())
+        return digest.hexdigest(), files
+
+    def _build(self, files: Dict[str, str]) -> None:
+        passages = [p for name, content in files.items() for p in split_passages(name, content)]
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        lengths = []
+        for i, passage in enumerate(passages):
+            tokens = tokenize(f"{passage['title']} {passage['section']} {passage['text']}")
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings[term].append((i, tf))
+        avg_length = sum(lengths) / len(lengths) if lengths else 0.0
+        self._index = (passages, dict(postings), lengths, avg_length)
+        self.builds += 1
+
+    def refresh(self, force: bool = False) -> None:
+        """Rebuilds the index if the files' content hash changed since the last build."""
+        now = time.monotonic()
+        if not force and self.fingerprint is not None and now - self._checked_at < self.check_seconds:
+            return
+        with self._lock:
+            if not force and self.fingerprint is not None and now - self._checked_at < self.check_seconds:
+                return
+            fingerprint, files = self._read_corpus()
+            self._checked_at = now
+            if force or fingerprint != self.fingerprint:
+                self._build(files)
+                self.fingerprint = fingerprint
+                print(f"policy index > built {len(self._index[0])} passages from {len(files)} files")
+
+    def search(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
+        """
+        The `top_k` best passages by BM25 score, each with its "score" and "coverage", the
+        share of the query's terms that occur in the passage.
+        """
+        self.refresh()
+        passages, postings, lengths, avg_length = self._index
+        n = len(passages)
+        terms = set(tokenize(query))
+        scores: Dict[int, float] = defaultdict(float)
+        matched: Dict[int, int] = defaultdict(int)
+        for term in terms:
+            matches = postings.get(term)
+            if not matches:
+                continue
+            idf = math.log(1 + (n - len(matches) + 0.5) / (len(matches) + 0.5))
+            for i, tf in matches:
+                norm = self.k1 * (1 - self.b + self.b * lengths[i] / avg_length)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+                matched[i] += 1
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [
+            {**passages[i], "score": round(score, 3), "coverage": round(matched[i] / len(terms), 2)}
+            for i, score in best
+        ]
+
+
+policy_index = PolicyIndex()
+
+
+def policy_context(
+    query: str,
+    top_k: int = 3,
+    min_score: float = POLICY_CONTEXT_MIN_SCORE,
+    min_coverage: float = POLICY_CONTEXT_MIN_COVERAGE,
+) -> Optional[str]:
+    """
+    Top passages for `query` formatted as run instructions, or None unless the best one
+    scores at least `min_score` and matches `min_coverage` of the query's terms (i.e. the
+    question is about policy rather than merely sharing a word with it).
+    """
+    results = policy_index.search(query, top_k)
+    if not results or results[0]["score"] < min_score or results[0]["coverage"] < min_coverage:
+        return None
+    results = [r for r in results if r["score"] >= min_score]
+    excerpts = "\n\n".join(f"[{r['source']} - {r['section']}]\n{r['text']}" for r in results)
+    return (
+        "Relevant excerpts from the company policy documents, retrieved for this question. "
+        "If they answer it, answer from them directly without calling file_search.\n\n" + excerpts
+    )
+
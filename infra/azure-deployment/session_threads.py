@@ -0,0 +1,179 @@
+"""
+Per-session agent threads for the Gradio server.
+
+Each browser session gets its own service thread, created on first use, and the display
+transcript of its chat so clients only send new messages. The service
+allows one active run per thread, so runs within a session are serialized while
+different sessions stream concurrently. Sessions idle for longer than `idle_seconds`
+are expired, and once more than `max_sessions` are held the least recently used idle
+session is evicted (checked whenever a run starts or ends); the service threads of
+dropped sessions are deleted in the background. One-off sessions (a caller with no session
+to come back to) are dropped as soon as their run ends.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional
+
+
+class SessionLimitError(RuntimeError):
+    """Raised when every tracked session is busy and no new session can be admitted."""
+
+
+class _Session:
+    def __init__(self, thread_id: str):
+        self.thread_id = thread_id
+        self.last_used = time.monotonic()
+        self.active = 0
+        self.orphaned = False
+        self.one_off = False
+        self.run_lock = threading.Lock()
+        self.transcript: List[Any] = []
+
+
+class SessionThreads:
+    def __init__(
+        self,
+        create_thread: Callable[[], str],
+        delete_thread: Optional[Callable[[str], None]] = None,
+        max_sessions: int = 500,
+        idle_seconds: float = 3600.0,
+    ):
+        self._create_thread = create_thread
+        self._delete_thread = delete_thread
+        self._max_sessions = max_sessions
+        self._idle_seconds = idle_seconds
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _evict_locked(self, now: float) -> List[str]:
+        """Drops expired sessions, then LRU idle sessions over the limit. Returns their thread ids."""
+        dropped = []
+        for session_id, session in list(self._sessions.items()):
+            if session.active == 0 and now - session.last_used > self._idle_seconds:
+                dropped.append(self._sessions.pop(session_id).thread_id)
+        for session_id, session in list(self._sessions.items()):
+            if len(self._sessions) <= self._max_sessions:
+                break
+            if session.active == 0:
+                dropped.append(self._sessions.pop(session_id).thread_id)
+        return dropped
+
+    def _discard(self, thread_ids: List[str]) -> None:
+        if not thread_ids:
+            return
+        print(f"sessions > dropped {len(thread_ids)} thread(s), {len(self._sessions)} held")
+        if self._delete_thread is None:
+            return
+
+        def delete_all():
+            for thread_id in thread_ids:
+                try:
+                    self._delete_thread(thread_id)
+                except Exception as e:
+                    print(f"sessions > failed to delete thread {thread_id}: {e}")
+
+        threading.Thread(target=delete_all, name="session-thread-cleanup", daemon=True).start()
+
+    def _get_or_create(self, session_id: str, one_off: bool = False) -> _Session:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                session.last_used = time.monotonic()
+                session.active += 1
+                return session
+            if len(self._sessions) >= self._max_sessions and all(
+                s.active for s in self._sessions.values()
+            ):
+                raise SessionLimitError(f"All {self._max_sessions} sessions are busy")
+
+        # Create the service thread outside the lock; another request for the same session
+        # may race us, in which case the loser's thread is discarded.
+        thread_id = self._create_thread()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session(thread_id)
+                session.one_off = one_off
+                print(f"thread > created (id: {thread_id}) for session {session_id}")
+                thread_id = None
+            self._sessions.move_to_end(session_id)
+            session.last_used = time.monotonic()
+            session.active += 1
+            dropped = self._evict_locked(session.last_used)
+        self._discard(dropped + ([thread_id] if thread_id else []))
+        return session
+
+    def _release(self, session: _Session) -> None:
+        with self._lock:
+            session.active -= 1
+            session.last_used = time.monotonic()
+            if session.one_off and not session.orphaned:
+                for session_id, held in list(self._sessions.items()):
+                    if held is session:
+                        del self._sessions[session_id]
+                session.orphaned = True
+            dropped = [session.thread_id] if session.orphaned and not session.active else []
+            dropped += self._evict_locked(session.last_used)
+        self._discard(dropped)
+
+    @contextmanager
+    def use(self, session_id: str, one_off: bool = False) -> Iterator[str]:
+        """
+        Yields the session's thread id, holding its run lock for the duration of a run.
+        A one-off session's thread is deleted when the run ends.
+        """
+        session = self._get_or_create(session_id, one_off)
+        try:
+            with session.run_lock:
+                yield session.thread_id
+        finally:
+            self._release(session)
+
+    @asynccontextmanager
+    async def use_async(self, session_id: str, one_off: bool = False) -> AsyncIterator[str]:
+        """use() for coroutines: thread creation runs off the event loop and lock waits don't block it."""
+        pending = asyncio.ensure_future(asyncio.to_thread(self._get_or_create, session_id, one_off))
+        try:
+            session = await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            # The lookup still completes in its worker thread; give the session back when it does.
+            pending.add_done_callback(
+                lambda done: None if done.cancelled() or done.exception() else self._release(done.result())
+            )
+            raise
+        try:
+            while not session.run_lock.acquire(blocking=False):
+                await asyncio.sleep(0.05)
+            try:
+                yield session.thread_id
+            finally:
+                session.run_lock.release()
+        finally:
+            self._release(session)
+
+    def transcript(self, session_id: str) -> List[Any]:
+        """
+        The session's display transcript, appended to in place by the run holding use();
+        an unknown session gets a new empty list.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+        return session.transcript if session is not None else []
+
+    def reset(self, session_id: str) -> None:
+        """Forgets the session's thread; the next run starts a fresh one."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                return
+            # A run still streaming on the old thread keeps it until the run finishes.
+            session.orphaned = True
+            dropped = [session.thread_id] if not session.active else []
+        self._discard(dropped)
@@ -0,0 +1,118 @@
+"""
+Single-flight coalescing for concurrent, identical tool calls.
+
+When several sessions ask for the same thing at once (a dozen people checking Seattle
+weather at 9:00), the first caller runs the function and everyone else with the same
+function name and normalized arguments waits for that execution and shares its result.
+Nothing is cached: once the in-flight call finishes, the next call runs again.
+"""
+import asyncio
+import inspect
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+# Functions with side effects must run once per request, never shared.
+NON_COALESCED_FUNCTIONS = {"send_email"}
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Runs fn, or joins an in-flight run with the same key. Returns (result, shared)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result, not leader
+
+
+class _LeaderCancelled(Exception):
+    """Set on a shared call whose leader was cancelled; a waiter takes over and reruns it."""
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines: waiters await the leader's future instead of blocking a thread."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, "asyncio.Future[Any]"] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        while True:
+            call = self._calls.get(key)
+            if call is None:
+                break
+            try:
+                # shield: a cancelled waiter must not cancel the leader's shared result
+                return await asyncio.shield(call), True
+            except _LeaderCancelled:
+                # The leader's session went away; the first waiter to wake up becomes the
+                # new leader below and the others join its run.
+                continue
+
+        call = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # Only this caller was cancelled: never pass the cancellation on to the waiters.
+            call.set_exception(_LeaderCancelled())
+            call.exception()
+            raise
+        except BaseException as e:
+            call.set_exception(e)
+            call.exception()  # mark retrieved when nobody else was waiting
+            raise
+        else:
+            call.set_result(result)
+            return result, False
+        finally:
+            del self._calls[key]
+
+
+def call_key(fn: Callable[..., Any], fn_name: str, arguments: str) -> Optional[Hashable]:
+    """
+    Normalizes a function call into a coalescing key: arguments are bound to the function
+    signature with defaults applied, so {"location": "Seattle"} and
+    {"location": " Seattle", "timeframe": "current"} are the same call. Returns None for
+    calls that must not be coalesced.
+    """
+    if fn_name in NON_COALESCED_FUNCTIONS:
+        return None
+    try:
+        parsed = json.loads(arguments or "{}")
+        if not isinstance(parsed, dict):
+            return None
+        bound = inspect.signature(fn).bind(**{
+            k: v.strip() if isinstance(v, str) else v for k, v in parsed.items()
+        })
+        bound.apply_defaults()
+        return fn_name, json.dumps(bound.arguments, sort_keys=True, default=str)
+    except (TypeError, ValueError):
+        # Invalid arguments: let the tool produce its own error, uncoalesced.
+        return None
@@ -6,5 +6,12 @@ which pip
 echo "Installing packages..."
 pip install --no-cache-dir -r /home/site/wwwroot/requirements.txt || { echo "Pip install failed"; exit 1; }
 
+# Shared directory so /metrics aggregates all gunicorn workers (cleared on every start)
+export PROMETHEUS_MULTIPROC_DIR=/tmp/prometheus_multiproc
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+# Tool caches (geocodes, forecasts, price history) shared by all gunicorn workers
+export TOOL_CACHE_BACKEND="${TOOL_CACHE_BACKEND:-sqlite}"
+
 echo "Starting Gunicorn..."
-gunicorn -w 4 -k uvicorn.workers.UvicornWorker main:app --bind 0.0.0.0:8000 --log-level debug
+gunicorn -w 4 -k uvicorn.workers.UvicornWorker main:app --bind 0.0.0.0:8000 --graceful-timeout 45 --log-level debug
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The web app's modules are flat files in infra/azure-deployment. Appended rather than
+# prepended: in a run from the repository root, the modules both apps ship (tool_cache,
+# enterprise_functions, ...) must still resolve to the root copies the root tests expect.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
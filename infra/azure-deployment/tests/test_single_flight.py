@@ -0,0 +1,111 @@
+import asyncio
+import threading
+
+import pytest
+
+from single_flight import AsyncSingleFlight, SingleFlight, call_key
+
+
+def test_followers_share_the_leader_result():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    runs = []
+
+    def fn():
+        runs.append(1)
+        started.set()
+        release.wait(5)
+        return "sunny"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do("k", fn)))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(flights.do("k", fn)))
+    follower.start()
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert len(runs) == 1
+    assert sorted(results) == [("sunny", False), ("sunny", True)]
+
+
+def test_call_key_normalizes_arguments():
+    def fetch_weather(location, country_code="", timeframe="current"):
+        pass
+
+    assert call_key(fetch_weather, "fetch_weather", '{"location": "Seattle"}') == call_key(
+        fetch_weather, "fetch_weather", '{"location": " Seattle", "timeframe": "current"}'
+    )
+    assert call_key(fetch_weather, "fetch_weather", '{"city": "Seattle"}') is None
+
+
+def test_call_key_skips_side_effects():
+    def send_email(recipient, subject, body):
+        pass
+
+    arguments = '{"recipient": "a@b.c", "subject": "s", "body": "b"}'
+    assert call_key(send_email, "send_email", arguments) is None
+
+
+def test_async_followers_share_the_leader_result_and_errors():
+    async def scenario():
+        flights = AsyncSingleFlight()
+        runs = []
+
+        async def fn():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            raise ValueError("quota exceeded")
+
+        results = await asyncio.gather(
+            flights.do("k", fn), flights.do("k", fn), return_exceptions=True
+        )
+        assert len(runs) == 1
+        assert all(isinstance(r, ValueError) for r in results)
+
+    asyncio.run(scenario())
+
+
+def test_async_leader_cancellation_hands_over_to_a_follower():
+    async def scenario():
+        flights = AsyncSingleFlight()
+        runs = []
+
+        async def fn():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return "sunny"
+
+        leader = asyncio.create_task(flights.do("k", fn))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(flights.do("k", fn)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        results = await asyncio.gather(*followers)
+        # One follower reran the call for the others; none of them saw the cancellation.
+        assert len(runs) == 2
+        assert sorted(results) == [("sunny", False), ("sunny", True), ("sunny", True)]
+
+    asyncio.run(scenario())
+
+
+def test_async_cancelled_follower_leaves_the_leader_running():
+    async def scenario():
+        flights = AsyncSingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            return "sunny"
+
+        leader = asyncio.create_task(flights.do("k", fn))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.do("k", fn))
+        await asyncio.sleep(0)
+        follower.cancel()
+        assert await leader == ("sunny", False)
+
+    asyncio.run(scenario())
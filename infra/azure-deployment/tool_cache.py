@@ -0,0 +1,226 @@
+"""
+Cache backends for tool results and geocodes.
+
+The tools cache geocodes, forecasts and price history with an absolute expiry per entry.
+By default every process keeps its own cache, so gunicorn workers (and parallel batch
+runs) each download the same data. A shared backend lets them share one cache:
+
+    TOOL_CACHE_BACKEND=memory     memory (per process), sqlite or redis
+    TOOL_CACHE_PATH=<tmp>/tool_cache.sqlite3     sqlite: one WAL database for every process on the host
+    TOOL_CACHE_URL=redis://localhost:6379/0      redis: any Redis-compatible server (needs the redis package)
+
+A shared backend is a string key/value store with an absolute expiry (get/set below);
+SharedCache puts a namespace in front of the keys and JSON-encodes keys and values.
+The backend is opened on first use; if it cannot be opened (bad path or URL, redis not
+installed) that cache falls back to a MemoryCache, and when the shared store fails later,
+lookups fall back to misses rather than failing the tool.
+
+Run `python tool_cache.py` to compare get/set latency of the backends.
+"""
+import itertools
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TOOL_CACHE_BACKEND = os.getenv("TOOL_CACHE_BACKEND", "memory").lower()
+TOOL_CACHE_PATH = os.getenv("TOOL_CACHE_PATH", os.path.join(tempfile.gettempdir(), "tool_cache.sqlite3"))
+TOOL_CACHE_URL = os.getenv("TOOL_CACHE_URL", "redis://localhost:6379/0")
+
+
+class MemoryCache:
+    """
+    A small thread-safe in-process cache where every entry carries its own
+    absolute expiry time (epoch seconds).
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self._max_entries = max_entries
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key: Hashable, value: Any, expires_at: float) -> None:
+        with self._lock:
+            if len(self._entries) >= self._max_entries and key not in self._entries:
+                # Drop whatever has expired first, then the entry closest to expiry.
+                now = time.time()
+                for k in [k for k, (exp, _) in self._entries.items() if exp <= now]:
+                    del self._entries[k]
+                if len(self._entries) >= self._max_entries:
+                    del self._entries[min(self._entries, key=lambda k: self._entries[k][0])]
+            self._entries[key] = (expires_at, value)
+
+
+class SQLiteBackend:
+    """Shared by every process on the host through one SQLite database in WAL mode."""
+
+    _PURGE_EVERY = 256
+
+    def __init__(self, path: str = TOOL_CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._sets = itertools.count(1)  # next() is atomic, unlike += across threads
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tool_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread, and never one inherited across a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT value FROM tool_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, expires_at: float) -> None:
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO tool_cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, expires_at),
+        )
+        if next(self._sets) % self._PURGE_EVERY == 0:
+            conn.execute("DELETE FROM tool_cache WHERE expires_at <= ?", (time.time(),))
+
+
+class RedisBackend:
+    """Any Redis-compatible server; entries expire server-side at their expiry time."""
+
+    def __init__(self, url: str = TOOL_CACHE_URL):
+        import redis  # optional dependency, only needed for this backend
+
+        self._client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._client.get(key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, value: str, expires_at: float) -> None:
+        self._client.set(key, value, pxat=int(expires_at * 1000))
+
+
+class SharedCache:
+    """MemoryCache's interface on a shared backend, under its own key namespace."""
+
+    def __init__(self, namespace: str, open_backend: Callable[[], Any], max_entries: int = 1024):
+        self.namespace = namespace
+        self._prefix = f"tool_cache:{namespace}:"
+        self._open_backend = open_backend
+        self._max_entries = max_entries
+        self._backend: Any = None
+        self._open_lock = threading.Lock()
+        self._failing = False
+
+    def _get_backend(self) -> Any:
+        # Opened on first use, so a misconfigured store cannot break importing the tools
+        if self._backend is None:
+            with self._open_lock:
+                if self._backend is None:
+                    try:
+                        self._backend = self._open_backend()
+                    except Exception as e:
+                        print(f"tool cache > {self.namespace}: shared backend unavailable, using a per-process cache: {e}")
+                        self._backend = MemoryCache(self._max_entries)
+        return self._backend
+
+    def _key(self, key: Hashable) -> str:
+        return self._prefix + json.dumps(key, default=str)
+
+    def _failed(self, action: str, error: Exception) -> None:
+        # Report the first failure of a streak, not every call
+        if not self._failing:
+            print(f"tool cache > {action} failed, treating as a miss: {error}")
+        self._failing = True
+
+    def get(self, key: Hashable) -> Any:
+        try:
+            value = self._get_backend().get(self._key(key))
+        except Exception as e:
+            self._failed("get", e)
+            return None
+        self._failing = False
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: Hashable, value: Any, expires_at: float) -> None:
+        try:
+            self._get_backend().set(self._key(key), json.dumps(value, default=str), expires_at)
+        except Exception as e:
+            self._failed("set", e)
+        else:
+            self._failing = False
+
+
+_backend_lock = threading.Lock()
+_shared_backend: Any = None
+
+
+def _get_shared_backend() -> Any:
+    global _shared_backend
+    with _backend_lock:
+        if _shared_backend is None:
+            _shared_backend = RedisBackend() if TOOL_CACHE_BACKEND == "redis" else SQLiteBackend()
+        return _shared_backend
+
+
+def tool_cache(namespace: str, max_entries: int = 1024) -> Any:
+    """The cache for one kind of tool data, on the backend selected by TOOL_CACHE_BACKEND."""
+    if TOOL_CACHE_BACKEND in ("sqlite", "redis"):
+        return SharedCache(namespace, _get_shared_backend, max_entries)
+    return MemoryCache(max_entries)
+
+
+if __name__ == "__main__":
+    # A geocode-sized and a forecast-sized entry, read back many times as the tools do.
+    geocode = [{"name": "Seattle", "lat": 47.6038, "lon": -122.3301, "country": "US", "state": "Washington"}]
+    forecast = {
+        "current": {"temp": 11.2, "humidity": 80, "weather": [{"description": "light rain"}]},
+        "hourly": [{"dt": 1700000000 + i * 3600, "temp": 10 + i % 5, "humidity": 70} for i in range(48)],
+        "daily": [{"dt": 1700000000 + i * 86400, "temp": {"day": 12, "min": 6, "max": 14}} for i in range(8)],
+    }
+    caches = {
+        "memory": MemoryCache(),
+        "sqlite": SharedCache("bench", lambda: SQLiteBackend(os.path.join(tempfile.gettempdir(), "tool_cache_bench.sqlite3"))),
+    }
+    if TOOL_CACHE_BACKEND == "redis":
+        caches["redis"] = SharedCache("bench", RedisBackend)
+
+    rounds = 2000
+    for name, cache in caches.items():
+        for label, value in (("geocode", geocode), ("forecast", forecast)):
+            expires_at = time.time() + 3600
+            started = time.perf_counter()
+            for i in range(rounds):
+                cache.set((label, i % 100), value, expires_at)
+            set_us = (time.perf_counter() - started) * 1e6 / rounds
+            started = time.perf_counter()
+            for i in range(rounds):
+                cache.get((label, i % 100))
+            get_us = (time.perf_counter() - started) * 1e6 / rounds
+            print(f"{name:7s} {label:9s} get {get_us:8.1f} us   set {set_us:8.1f} us")
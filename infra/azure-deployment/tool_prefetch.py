@@ -0,0 +1,193 @@
+"""
+Speculative tool prefetch from the user's message.
+
+Many questions name exactly what the agent will look up: a city next to "weather", a
+company or ticker next to "stock". extract_intents() spots those with a few keyword
+rules (a ", WA" or ", France" after the city becomes the state/country code), and Prefetcher runs the matching fetch_weather / fetch_stock_price(s) calls in a
+small thread pool while the run is still being queued and planned. The tools cache their
+upstream data (geocodes, forecasts, price history), so by the time the run asks for the
+call it is a cache hit; a call that arrives while its prefetch is still running waits for
+it instead of downloading the same data twice.
+
+Outcomes are reported through `on_outcome(function, outcome)`: "started", "hit" (a
+prediction the run used), "wasted" (unclaimed after `claim_seconds`) and "miss" (a
+prefetchable call nobody predicted).
+"""
+import json
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_WEATHER_WORDS = {
+    "weather", "rain", "raining", "rainy", "snow", "snowing", "temperature", "forecast",
+    "humidity", "humid", "umbrella", "storm", "uv", "wind", "windy", "sunny", "degrees",
+}
+_STOCK_WORDS = {"stock", "stocks", "share", "shares", "ticker", "nasdaq", "nyse", "market"}
+
+# Company names people use instead of tickers
+_COMPANY_TICKERS = {
+    "microsoft": "MSFT", "apple": "AAPL", "tesla": "TSLA", "google": "GOOGL",
+    "alphabet": "GOOGL", "amazon": "AMZN", "nvidia": "NVDA", "meta": "META",
+    "facebook": "META", "netflix": "NFLX", "ibm": "IBM", "intel": "INTC", "oracle": "ORCL",
+}
+# Upper-case words that are not tickers
+_NOT_TICKERS = {"AI", "API", "CEO", "HR", "IT", "NYSE", "OK", "PTO", "UK", "US", "USA", "UV"}
+_NOT_PLACES = {
+    "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday",
+    "January", "February", "March", "April", "May", "June", "July", "August",
+    "September", "October", "November", "December", "The",
+}
+
+_US_STATES = {
+    "AL", "AK", "AZ", "AR", "CA", "CO", "CT", "DE", "FL", "GA", "HI", "ID", "IL", "IN", "IA",
+    "KS", "KY", "LA", "ME", "MD", "MA", "MI", "MN", "MS", "MO", "MT", "NE", "NV", "NH", "NJ",
+    "NM", "NY", "NC", "ND", "OH", "OK", "OR", "PA", "RI", "SC", "SD", "TN", "TX", "UT", "VT",
+    "VA", "WA", "WV", "WI", "WY", "DC",
+}
+_COUNTRY_CODES = {
+    "us": "US", "usa": "US", "united states": "US", "uk": "GB", "united kingdom": "GB",
+    "england": "GB", "canada": "CA", "france": "FR", "germany": "DE", "spain": "ES",
+    "italy": "IT", "ireland": "IE", "netherlands": "NL", "india": "IN", "japan": "JP",
+    "china": "CN", "australia": "AU", "mexico": "MX", "brazil": "BR",
+}
+
+_PLACE_RE = re.compile(
+    r"\b(?:in|for|at)\s+([A-Z][\w.'-]*(?:\s+[A-Z][\w.'-]*){0,2})(?:,\s*([A-Z][A-Za-z]*(?:\s+[A-Z][a-z]+)?))?"
+)
+_TICKER_RE = re.compile(r"\b[A-Z]{2,5}\b")
+_PERIODS = (("year", "1y"), ("month", "1mo"), ("week", "5d"))
+
+
+def _words(message: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", message.lower().replace("'s", ""))
+
+
+def extract_intents(message: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """Returns the (function name, arguments) calls the message most likely leads to."""
+    words = _words(message)
+    word_set = set(words)
+    intents: List[Tuple[str, Dict[str, Any]]] = []
+
+    if word_set & _WEATHER_WORDS:
+        for match in _PLACE_RE.finditer(message):
+            place = " ".join(w for w in match.group(1).split() if w not in _NOT_PLACES).rstrip(".'")
+            if not place:
+                continue
+            arguments = {"location": place}
+            qualifier = (match.group(2) or "").strip()
+            if qualifier in _US_STATES:
+                arguments.update(country_code="US", state_code=qualifier)
+            elif qualifier.lower() in _COUNTRY_CODES:
+                arguments["country_code"] = _COUNTRY_CODES[qualifier.lower()]
+            intents.append(("fetch_weather", arguments))
+
+    if word_set & _STOCK_WORDS:
+        tickers = [_COMPANY_TICKERS[w] for w in words if w in _COMPANY_TICKERS]
+        tickers += [t for t in _TICKER_RE.findall(message) if t not in _NOT_TICKERS]
+        tickers = list(dict.fromkeys(tickers))
+        period = next((p for word, p in _PERIODS if word in word_set), "1d")
+        if len(tickers) == 1:
+            intents.append(("fetch_stock_price", {"ticker_symbol": tickers[0], "period": period}))
+        elif tickers:
+            intents.append(("fetch_stock_prices", {"ticker_symbols": tickers, "period": period}))
+    return intents
+
+
+def prediction_keys(fn_name: str, arguments: Dict[str, Any]) -> List[Tuple[str, ...]]:
+    """What a call looks up, in the form shared by prefetches and the run's own calls."""
+    if fn_name == "fetch_weather":
+        # The geocode query fetch_weather builds (and caches under): a state only counts with a country
+        location = str(arguments.get("location") or "").strip()
+        country = str(arguments.get("country_code") or "").strip()
+        state = str(arguments.get("state_code") or "").strip()
+        if not location:
+            return []
+        if country and state:
+            query = f"{location},{state},{country}"
+        elif country:
+            query = f"{location},{country}"
+        else:
+            query = location
+        return [("weather", query.lower())]
+    if fn_name in ("fetch_stock_price", "fetch_stock_prices"):
+        if arguments.get("start") or arguments.get("end") or arguments.get("interval", "1d") != "1d":
+            return []
+        symbols = arguments.get("ticker_symbols") or [arguments.get("ticker_symbol")]
+        period = arguments.get("period") or "1d"
+        return [("stock", str(s).strip().upper(), period) for s in symbols if s]
+    return []
+
+
+class Prefetcher:
+    def __init__(
+        self,
+        functions: Dict[str, Callable[..., Any]],
+        max_workers: int = 4,
+        claim_seconds: float = 120.0,
+        on_outcome: Optional[Callable[[str, str], None]] = None,
+    ):
+        self._functions = functions
+        self._claim_seconds = claim_seconds
+        self._on_outcome = on_outcome
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool-prefetch")
+        # prediction key -> (function name, future, started at)
+        self._pending: Dict[Tuple[str, ...], Tuple[str, Future, float]] = {}
+        self._lock = threading.Lock()
+
+    def _report(self, fn_name: str, outcome: str) -> None:
+        if self._on_outcome:
+            self._on_outcome(fn_name, outcome)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, (_, _, started) in self._pending.items() if now - started > self._claim_seconds]
+            wasted = [self._pending.pop(k)[0] for k in expired]
+        for fn_name in wasted:
+            self._report(fn_name, "wasted")
+
+    def prefetch(self, message: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """Starts the calls `message` predicts; returns the ones started."""
+        self._expire()
+        started = []
+        for fn_name, arguments in extract_intents(message):
+            fn = self._functions.get(fn_name)
+            keys = prediction_keys(fn_name, arguments)
+            if fn is None or not keys:
+                continue
+            with self._lock:
+                if all(k in self._pending for k in keys):
+                    continue
+                future = self._executor.submit(fn, **arguments)
+                for key in keys:
+                    self._pending.setdefault(key, (fn_name, future, time.monotonic()))
+            started.append((fn_name, arguments))
+            self._report(fn_name, "started")
+        return started
+
+    def claim(self, fn_name: str, arguments: str) -> List[Future]:
+        """
+        Called before the run executes a tool call (`arguments` as sent by the service).
+        Returns the prefetches it can use; wait for them, then run the call against the
+        warmed cache.
+        """
+        try:
+            keys = prediction_keys(fn_name, json.loads(arguments or "{}"))
+        except (TypeError, ValueError):
+            return []
+        if not keys:
+            return []
+        with self._lock:
+            claimed = [self._pending.pop(k, None) for k in keys]
+        futures = []
+        for entry in claimed:
+            self._report(fn_name, "hit" if entry else "miss")
+            if entry and entry[1] not in futures:
+                futures.append(entry[1])
+        self._expire()
+        return futures
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+
+import enterprise_functions as ef
+import enterprise_functions_aio as efa
+
+
+class _Response:
+    status_code = 200
+
+
+def test_steps_run_off_the_event_loop(monkeypatch):
+    async def fake_request(method, url, **kwargs):
+        return _Response()
+
+    monkeypatch.setattr(efa, "_http_request", fake_request)
+    threads = []
+
+    def steps():
+        # Stands in for the cache lookups (SQLite/Redis) around a tool's requests
+        threads.append(threading.get_ident())
+        response = yield ("GET", "https://example.invalid/geo", {})
+        threads.append(threading.get_ident())
+        yield ("GET", "https://example.invalid/forecast", {})
+        threads.append(threading.get_ident())
+        return f"done {response.status_code}"
+
+    assert asyncio.run(efa._run_http_steps(steps())) == "done 200"
+    assert len(threads) == 3
+    assert threading.get_ident() not in threads
+
+
+def test_cancelled_call_releases_the_breaker_probe(monkeypatch):
+    breaker = ef._CircuitBreaker("openweather", failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    monkeypatch.setitem(ef._breakers, "openweather", breaker)
+
+    async def slow_request(method, url, **kwargs):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(efa, "_http_request", slow_request)
+
+    def steps():
+        yield from ef._guarded_request("openweather", ("GET", "https://example.invalid", {}))
+        return "unreachable"
+
+    async def scenario():
+        task = asyncio.create_task(efa._run_http_steps(steps()))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0)  # the steps are closed from a done callback
+
+    asyncio.run(scenario())
+    assert breaker.state == "half_open"
+    breaker.before_call()  # the probe slot is free again
@@ -0,0 +1,70 @@
+import pytest
+
+import enterprise_functions as ef
+
+
+def _open_breaker(reset_seconds: float) -> ef._CircuitBreaker:
+    breaker = ef._CircuitBreaker("openweather", failure_threshold=2, reset_seconds=reset_seconds)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+def test_opens_after_threshold_and_fails_fast():
+    breaker = ef._CircuitBreaker("openweather", failure_threshold=2, reset_seconds=60)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(ef.CircuitOpenError) as e:
+        breaker.before_call()
+    assert e.value.to_result()["circuit"] == "open"
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = _open_breaker(reset_seconds=0)
+    assert breaker.state == "half_open"
+    breaker.before_call()
+    with pytest.raises(ef.CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_failed_probe_reopens():
+    breaker = _open_breaker(reset_seconds=0)
+    breaker.before_call()
+    breaker.record_failure()
+    breaker._reset_seconds = 60
+    assert breaker.state == "open"
+
+
+def test_abandoned_probe_is_released_without_a_failure(monkeypatch):
+    breaker = _open_breaker(reset_seconds=0)
+    monkeypatch.setitem(ef._breakers, "openweather", breaker)
+    steps = ef._guarded_request("openweather", ("GET", "https://example.invalid", {}))
+    next(steps)
+    steps.close()  # e.g. the awaiting task was cancelled mid-request
+    assert breaker._failures == 2
+    breaker.before_call()  # the probe slot is free again
+
+
+def test_abandoned_calls_do_not_open_the_circuit(monkeypatch):
+    breaker = ef._CircuitBreaker("openweather", failure_threshold=2, reset_seconds=60)
+    monkeypatch.setitem(ef._breakers, "openweather", breaker)
+    for _ in range(5):
+        steps = ef._guarded_request("openweather", ("GET", "https://example.invalid", {}))
+        next(steps)
+        steps.close()
+    assert breaker.state == "closed"
+
+
+def test_transport_errors_count_as_failures(monkeypatch):
+    breaker = ef._CircuitBreaker("openweather", failure_threshold=1, reset_seconds=60)
+    monkeypatch.setitem(ef._breakers, "openweather", breaker)
+    steps = ef._guarded_request("openweather", ("GET", "https://example.invalid", {}))
+    next(steps)
+    with pytest.raises(ConnectionError):
+        steps.throw(ConnectionError("reset"))
+    assert breaker.state == "open"
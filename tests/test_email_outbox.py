@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+from email_outbox import EmailOutbox
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {"t": 1_700_000_000.0}
+    monkeypatch.setattr(time, "time", lambda: now["t"])
+    return now
+
+
+def _outbox(tmp_path, deliver, **kwargs) -> EmailOutbox:
+    outbox = EmailOutbox(str(tmp_path / "outbox.sqlite3"), deliver, **kwargs)
+    outbox.start = lambda: None  # the tests drive delivery themselves
+    return outbox
+
+
+def test_claimed_messages_are_leased(tmp_path, clock):
+    outbox = _outbox(tmp_path, lambda m: (True, False, "ok"), lease_seconds=60)
+    email_id = outbox.enqueue("a@example.com", "Hi", "Body")
+
+    batch = outbox._claim_batch()
+    assert [m["id"] for m in batch] == [email_id]
+    assert outbox.status(email_id)["status"] == "sending"
+    # Under the lease nobody else (another worker) can claim it
+    assert outbox._claim_batch() == []
+
+    # A worker that died mid-delivery leaves the lease to expire; then it is claimed again
+    clock["t"] += 60
+    batch = outbox._claim_batch()
+    assert [(m["id"], m["attempts"]) for m in batch] == [(email_id, 2)]
+
+
+def test_transient_failures_back_off_exponentially(tmp_path, clock):
+    outbox = _outbox(
+        tmp_path, lambda m: (False, True, "HTTP 503"), max_attempts=3, base_backoff_seconds=2.0
+    )
+    email_id = outbox.enqueue("a@example.com", "Hi", "Body")
+    started = clock["t"]
+
+    outbox._deliver_batch(outbox._claim_batch())
+    assert outbox.status(email_id)["status"] == "queued"
+    assert outbox._pending() == (1, started + 2)
+
+    clock["t"] = started + 1
+    assert outbox._claim_batch() == []  # still backing off
+    clock["t"] = started + 2
+    outbox._deliver_batch(outbox._claim_batch())
+    assert outbox._pending() == (1, started + 2 + 4)
+
+    clock["t"] = started + 6
+    outbox._deliver_batch(outbox._claim_batch())
+    record = outbox.status(email_id)
+    assert (record["status"], record["attempts"], record["last_error"]) == ("failed", 3, "HTTP 503")
+    assert outbox._pending() == (0, None)
+
+
+def test_permanent_failures_and_exceptions(tmp_path, clock):
+    results = {"bad@example.com": (False, False, "HTTP 400")}
+
+    def deliver(message):
+        if message["recipient"] == "boom@example.com":
+            raise ConnectionError("reset")
+        return results.get(message["recipient"], (True, False, "accepted"))
+
+    outbox = _outbox(tmp_path, deliver)
+    sent = outbox.enqueue("a@example.com", "Hi", "Body")
+    bad = outbox.enqueue("bad@example.com", "Hi", "Body")
+    boom = outbox.enqueue("boom@example.com", "Hi", "Body")
+    outbox._deliver_batch(outbox._claim_batch())
+
+    assert outbox.status(sent)["status"] == "sent"
+    assert outbox.status(sent)["response"] == "accepted"
+    assert outbox.status(bad)["status"] == "failed"
+    # An exception from the transport is treated as transient
+    assert outbox.status(boom)["status"] == "queued"
+    assert outbox.status(boom)["last_error"] == "ConnectionError: reset"
+
+
+def test_flush_waits_out_the_backoff(tmp_path):
+    attempts = []
+
+    def deliver(message):
+        attempts.append(message["attempts"])
+        return (len(attempts) > 1, True, "ok" if len(attempts) > 1 else "HTTP 503")
+
+    outbox = _outbox(tmp_path, deliver, base_backoff_seconds=0.05, poll_interval_seconds=0.05)
+    email_id = outbox.enqueue("a@example.com", "Hi", "Body")
+    assert outbox.flush(timeout=5) == 0
+    assert attempts == [1, 2]
+    assert outbox.status(email_id)["status"] == "sent"
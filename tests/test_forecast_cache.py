@@ -0,0 +1,80 @@
+import json
+import time
+
+import pytest
+
+import enterprise_functions as ef
+from tool_cache import MemoryCache
+
+SLOT = ef._FORECAST_SLOT_SECONDS
+# 2025-01-06 09:00:00 UTC, a 3-hour slot boundary
+BOUNDARY = 1736154000
+
+
+class _Response:
+    def __init__(self, payload):
+        self.status_code = 200
+        self._payload = payload
+        self.text = json.dumps(payload)
+
+    def json(self):
+        return self._payload
+
+
+@pytest.fixture
+def weather(monkeypatch):
+    """Runs fetch_weather's steps against canned OpenWeather answers at a settable time."""
+    clock = {"now": 0.0}
+    requests = []
+    monkeypatch.setattr(time, "time", lambda: clock["now"])
+    monkeypatch.setenv("OPENWEATHER_ONE_API_KEY", "test")
+    monkeypatch.setattr(ef, "_geocode_cache", MemoryCache())
+    monkeypatch.setattr(ef, "_forecast_cache", MemoryCache())
+    monkeypatch.setitem(ef._breakers, "openweather", ef._CircuitBreaker("openweather", 5, 30))
+
+    def answer(url):
+        requests.append(url)
+        if "/geo/" in url:
+            return _Response([{"name": "Seattle", "lat": 47.6038, "lon": -122.3301}])
+        return _Response({"list": [
+            {"dt_txt": f"slot {i}", "main": {"temp": 10 + i, "humidity": 70}} for i in range(16)
+        ]})
+
+    def fetch(at, **kwargs):
+        clock["now"] = at
+        steps = ef._fetch_weather_steps("Seattle", **kwargs)
+        try:
+            method, url, _ = next(steps)
+            while True:
+                method, url, _ = steps.send(answer(url))
+        except StopIteration as done:
+            return json.loads(done.value)
+
+    return fetch, requests
+
+
+def test_next_slot_boundary():
+    assert ef._next_slot_boundary(BOUNDARY - 1, SLOT) == BOUNDARY
+    assert ef._next_slot_boundary(BOUNDARY, SLOT) == BOUNDARY + SLOT
+    assert ef._next_slot_boundary(BOUNDARY + 1, SLOT) == BOUNDARY + SLOT
+
+
+def test_forecast_is_served_from_cache_until_the_slot_ends(weather):
+    fetch, requests = weather
+    assert fetch(BOUNDARY + 60)["temperature_c"] == 10
+    assert len(requests) == 2  # geocode + forecast
+
+    # Any timeframe within the same slot is a selection from the cached forecast
+    assert fetch(BOUNDARY + SLOT - 1, timeframe="hourly", time_offset=1)["forecast_time"] == "slot 1"
+    assert fetch(BOUNDARY + SLOT - 1, timeframe="daily", time_offset=1)["forecast_time"] == "slot 8"
+    assert len(requests) == 2
+
+    # At the boundary the provider has published a new slot
+    fetch(BOUNDARY + SLOT)
+    assert len(requests) == 3
+    assert "/data/2.5/forecast" in requests[-1]
+
+
+def test_offsets_past_the_forecast_are_errors(weather):
+    fetch, _ = weather
+    assert "error" in fetch(BOUNDARY, timeframe="daily", time_offset=5)
@@ -0,0 +1,53 @@
+import asyncio
+
+import httpx
+
+import enterprise_functions as ef
+import enterprise_functions_aio as efa
+
+
+class _UrllibResponse:
+    def __init__(self, status, retry_after):
+        self.status = status
+        self.headers = {"Retry-After": retry_after}
+
+    def getheader(self, name):
+        return self.headers.get(name)
+
+
+def test_sync_retry_after_is_capped():
+    retry = ef._http_session.adapters["https://"].max_retries
+    assert retry.get_retry_after(_UrllibResponse(429, "3600")) == ef.HTTP_RETRY_AFTER_MAX_SECONDS
+    assert retry.get_retry_after(_UrllibResponse(503, "1")) == 1
+    # Retry objects are replaced by new() on every attempt; the cap must survive that
+    assert isinstance(retry.new(), ef._CappedRetry)
+
+
+def test_retry_after_only_for_rate_limits_and_unavailable():
+    assert ef._retry_after_seconds(500, "3") is None
+    assert ef._retry_after_seconds(429, "not a date") is None
+    assert ef._retry_after_seconds(429, None) is None
+
+
+def test_async_retries_wait_like_the_sync_session(monkeypatch):
+    responses = [
+        httpx.Response(429, headers={"Retry-After": "3600"}),
+        httpx.Response(503),
+        httpx.Response(200),
+    ]
+
+    class Client:
+        async def request(self, method, url, **kwargs):
+            return responses.pop(0)
+
+    waits = []
+
+    async def fake_sleep(seconds):
+        waits.append(seconds)
+
+    monkeypatch.setattr(efa, "_get_client", Client)
+    monkeypatch.setattr(efa, "HTTP_GET_RETRIES", 2)
+    monkeypatch.setattr(efa.asyncio, "sleep", fake_sleep)
+    response = asyncio.run(efa._send_with_retries("GET", "https://example.invalid"))
+    assert response.status_code == 200
+    assert waits == [ef.HTTP_RETRY_AFTER_MAX_SECONDS, 0.6]
@@ -0,0 +1,25 @@
+from datetime import datetime
+
+import pytest
+
+import enterprise_functions as ef
+
+
+def _ny(*args) -> float:
+    return datetime(*args, tzinfo=ef._MARKET_TZ).timestamp()
+
+
+def test_open_market_uses_the_short_ttl():
+    now = _ny(2025, 3, 12, 11, 0)  # Wednesday
+    assert ef._stock_cache_expiry(now) == now + ef.STOCK_OPEN_TTL_SECONDS
+
+
+@pytest.mark.parametrize("fetched, next_open", [
+    ((2025, 3, 12, 8, 0), (2025, 3, 12, 9, 30)),    # Wednesday before the open
+    ((2025, 3, 12, 16, 0), (2025, 3, 13, 9, 30)),   # Wednesday at the close
+    ((2025, 3, 14, 18, 0), (2025, 3, 17, 9, 30)),   # Friday evening -> Monday
+    ((2025, 3, 15, 12, 0), (2025, 3, 17, 9, 30)),   # Saturday -> Monday
+    ((2025, 3, 7, 17, 0), (2025, 3, 10, 9, 30)),    # across the DST change, still 09:30 local
+])
+def test_closed_market_caches_until_the_next_open(fetched, next_open):
+    assert ef._stock_cache_expiry(_ny(*fetched)) == _ny(*next_open)
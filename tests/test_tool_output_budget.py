@@ -0,0 +1,51 @@
+import json
+
+import tool_output_budget as tob
+
+
+def test_output_within_the_limit_is_untouched():
+    output = json.dumps({"temperature_c": 11.2})
+    assert tob.budget_tool_output("fetch_weather", output, limit=100) == (output, None)
+
+
+def test_long_arrays_are_downsampled_keeping_both_ends():
+    rows = [{"date": f"2025-01-{i:04d}", "close": i} for i in range(500)]
+    output = json.dumps({"ticker_symbol": "MSFT", "data": rows})
+
+    clipped, record = tob.budget_tool_output("fetch_stock_price", output, limit=2000)
+    data = json.loads(clipped)
+    assert len(clipped) <= 2000
+    assert data["data"][0] == rows[0] and data["data"][-1] == rows[-1]
+    assert 2 <= len(data["data"]) < len(rows)
+    assert data["ticker_symbol"] == "MSFT"
+    assert data["_truncated"] == {"original_chars": len(output), "limit": 2000}
+    assert record == {
+        "tool": "fetch_stock_price", "original_chars": len(output), "limit": 2000,
+        "strategy": "json", "final_chars": len(clipped),
+    }
+
+
+def test_long_strings_are_cut_with_a_note():
+    output = json.dumps({"message": "Email sent.", "response": "x" * 5000})
+    clipped, record = tob.budget_tool_output("send_email", output, limit=1000)
+    data = json.loads(clipped)
+    assert len(clipped) <= 1000
+    assert data["message"] == "Email sent."
+    assert data["response"].startswith("xxx") and data["response"].endswith("chars]")
+    assert record["strategy"] == "json"
+
+
+def test_plain_text_and_unshrinkable_json_fall_back_to_text():
+    clipped, record = tob.budget_tool_output("bing", "word " * 1000, limit=300)
+    assert len(clipped) == 300 and clipped.endswith("to 300]")
+    assert record["strategy"] == "text"
+
+    many_keys = json.dumps({f"key{i}": i for i in range(500)})
+    clipped, record = tob.budget_tool_output("fetch_weather", many_keys, limit=300)
+    assert len(clipped) == 300
+    assert record["strategy"] == "text"
+
+
+def test_per_tool_limits():
+    limits = tob._parse_limits("fetch_stock_price=4000, send_email=2000,broken,bad=x")
+    assert limits == {"fetch_stock_price": 4000, "send_email": 2000}
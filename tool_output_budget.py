@@ -0,0 +1,101 @@
+"""
+Size budgeting for function tool outputs before they go back through submit_tool_outputs.
+
+Every output is held to a per-tool character limit. JSON outputs are shrunk structurally
+(long strings are cut, long arrays are evenly downsampled keeping their first and last
+items) so the model still receives valid JSON with the most useful shape; anything else
+is cut as plain text. Clipped JSON objects carry a "_truncated" note for the model, and
+the caller gets a record of what was clipped for its own logs.
+
+Limits come from the environment:
+    TOOL_OUTPUT_MAX_CHARS=8000                          default limit for every tool
+    TOOL_OUTPUT_LIMITS=fetch_stock_price=4000,send_email=2000   per-tool overrides
+"""
+import json
+import os
+from typing import Any, Dict, Optional, Tuple
+
+TOOL_OUTPUT_MAX_CHARS = int(os.getenv("TOOL_OUTPUT_MAX_CHARS", "8000"))
+
+_MIN_STRING_CHARS = 64
+_MIN_LIST_ITEMS = 2
+
+
+def _parse_limits(spec: str) -> Dict[str, int]:
+    limits = {}
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip().isdigit():
+            limits[name.strip()] = int(value)
+    return limits
+
+
+TOOL_OUTPUT_LIMITS = _parse_limits(os.getenv("TOOL_OUTPUT_LIMITS", ""))
+
+
+def limit_for(fn_name: str) -> int:
+    return TOOL_OUTPUT_LIMITS.get(fn_name, TOOL_OUTPUT_MAX_CHARS)
+
+
+def _shrink(value: Any, max_string: int, max_items: int) -> Any:
+    if isinstance(value, str) and len(value) > max_string:
+        return value[:max_string] + f"...[+{len(value) - max_string} chars]"
+    if isinstance(value, list):
+        if len(value) > max_items:
+            step = (len(value) - 1) / (max_items - 1)
+            value = [value[round(i * step)] for i in range(max_items)]
+        return [_shrink(v, max_string, max_items) for v in value]
+    if isinstance(value, dict):
+        return {k: _shrink(v, max_string, max_items) for k, v in value.items()}
+    return value
+
+
+def _max_list_len(value: Any) -> int:
+    if isinstance(value, list):
+        return max([len(value)] + [_max_list_len(v) for v in value])
+    if isinstance(value, dict):
+        return max([0] + [_max_list_len(v) for v in value.values()])
+    return 0
+
+
+def _text_fallback(output: str, limit: int) -> str:
+    marker = f"...[truncated {len(output)} chars to {limit}]"
+    return output[:max(0, limit - len(marker))] + marker
+
+
+def budget_tool_output(
+    fn_name: str, output: str, limit: Optional[int] = None
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Returns (output, clip_record). clip_record is None when the output already fit,
+    otherwise it describes the original and final sizes and how the output was reduced.
+    """
+    limit = limit or limit_for(fn_name)
+    if len(output) <= limit:
+        return output, None
+
+    record: Dict[str, Any] = {"tool": fn_name, "original_chars": len(output), "limit": limit}
+    try:
+        data = json.loads(output)
+    except (TypeError, ValueError):
+        data = None
+
+    if isinstance(data, (dict, list)):
+        max_string, max_items = limit, max(_MIN_LIST_ITEMS, _max_list_len(data))
+        while True:
+            shrunk = _shrink(data, max_string, max_items)
+            if isinstance(shrunk, dict):
+                shrunk["_truncated"] = {"original_chars": len(output), "limit": limit}
+            clipped = json.dumps(shrunk)
+            if len(clipped) <= limit:
+                record.update(strategy="json", final_chars=len(clipped))
+                return clipped, record
+            if max_string <= _MIN_STRING_CHARS and max_items <= _MIN_LIST_ITEMS:
+                break
+            max_string = max(_MIN_STRING_CHARS, max_string // 2)
+            max_items = max(_MIN_LIST_ITEMS, max_items // 2)
+
+    clipped = _text_fallback(output, limit)
+    record.update(strategy="text", final_chars=len(clipped))
+    return clipped, record
+